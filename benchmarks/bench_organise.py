@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+
+"""Benchmarks Course.organise against synthetic course chapters and
+Course.from_url against a local stand-in for LearnItFirst.com, recording the
+throughput and peak RSS of each scenario and failing if either regresses.
+
+The chapters are generated in the layout of the README examples, i.e.
+SSAS2008_ChapterNN.zip files, or SSAS2008_ChapterNN directories, containing
+ChNN_MM_description.avi and .pdf lesson files.  They are organised into a
+destination on the same device, where files are renamed, and, if one is
+available, on another device, where they are copied; by default /dev/shm
+(tmpfs) is used as the other device, but a loopback mount or any directory
+on a second disk can be passed instead.  The stand-in serves the pages in
+benchmarks/fixtures (see make_fixtures.py).
+
+The discovery scenario plans directory chapters, without moving them, from a
+source directory padded with thousands of unrelated entries, as a shared
+downloads directory would be, so its MB/s is the bytes planned per second.
+
+Each scenario runs in a freshly spawned process so that its peak RSS is its
+own.  Compare against a saved baseline with --baseline, or set absolute
+limits with --min-mbps and --max-rss.
+
+No threshold is built in, since throughput depends on the disks and CPU far
+more than on the code.  A baseline is made with --save on the machine that
+will later check against it, e.g. before a change, and records the workload
+options, Python version and platform it was made with; a comparison with
+other workload options is refused and a different Python or platform is
+warned about.  The default --tolerance of 20% is about the spread between
+repeated default runs of the extract and copy scenarios on one idle machine.
+The same-device directory and discovery scenarios rename or plan rather than
+copy and take tens of milliseconds at the defaults, so they vary by more
+than that; raise --chapters before comparing them.
+"""
+
+from concurrent import futures
+from http import server
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+_BENCHMARKS_DIR_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_BENCHMARKS_DIR_PATH, os.pardir))
+
+
+_FIXTURES_DIR_PATH = os.path.join(_BENCHMARKS_DIR_PATH, "fixtures")
+_CHAPTER_PATTERN = r"SSAS2008_Chapter(\d+)(?:.zip|)"
+_LESSON_PATTERN = r"Ch\d+_(\d+)(?:_|)([^\.]*)(?:\.\w+|)"
+_COURSE_ID = 165
+# The options that decide the work done by each scenario, which must match
+# for two runs to be compared.
+_WORKLOAD_OPTIONS = ("chapters", "lessons", "size", "deflate", "workers",
+                     "extractworkers", "entries", "repeats")
+# The key under which a baseline file records how it was made.
+_SETTINGS_KEY = "_settings"
+_BLOCK = os.urandom(1024 * 1024)
+
+
+def _content(size):
+    # Random data so that a deflated zip costs what a real video would, built
+    # from one block so that generating gigabytes stays quick.
+    return (_BLOCK * (size // len(_BLOCK) + 1))[:size]
+
+
+def generate(src, chapters, lessons, file_size, as_zip, compression):
+    """Write synthetic chapters into src and return the bytes written."""
+    total = 0
+    for chapter_num in range(1, chapters + 1):
+        members = []
+        for lesson_num in range(1, lessons + 1):
+            stem = "Ch%02d_%02d_lesson description %s" % (chapter_num,
+                                                          lesson_num,
+                                                          lesson_num)
+            members.append((stem + ".avi", file_size))
+            members.append((stem + ".pdf", file_size // 10))
+        members.append(("index.html", 1024))
+        name = "SSAS2008_Chapter%02d" % chapter_num
+        if as_zip:
+            with zipfile.ZipFile(os.path.join(src, name + ".zip"), "w",
+                                 compression) as zip_file:
+                for member_name, size in members:
+                    zip_file.writestr("%s/%s" % (name, member_name),
+                                      _content(size))
+                    total += size
+        else:
+            chapter_path = os.path.join(src, name, name)
+            os.makedirs(chapter_path)
+            for member_name, size in members:
+                with open(os.path.join(chapter_path, member_name), "wb") as fp:
+                    fp.write(_content(size))
+                total += size
+    return total
+
+
+def pad(src, entries):
+    """Write entries empty files that match no chapter pattern into src."""
+    for entry_num in range(entries):
+        with open(os.path.join(src, "download-%06d.tmp" % entry_num), "wb"):
+            pass
+
+
+def _course(chapters, lessons):
+    import liforganiser
+    return liforganiser.Course(_COURSE_ID, "165 - Synthetic Course", {
+        chapter_num: liforganiser._Chapter(
+            chapter_num, "%02d - Chapter %s" % (chapter_num, chapter_num), {
+                lesson_num: liforganiser._Lesson(
+                    lesson_num, "c%03dch%02dl%02d - Lesson %s" %
+                    (_COURSE_ID, chapter_num, lesson_num, lesson_num))
+                for lesson_num in range(1, lessons + 1)})
+        for chapter_num in range(1, chapters + 1)}, logging.CRITICAL)
+
+
+def _log_to(dir_path):
+    # Write the package's log to the scenario's temporary directory rather
+    # than into the package being measured.
+    import liforganiser
+    root_logger = logging.getLogger()
+    root_logger.removeHandler(liforganiser._file_handler)
+    handler = logging.FileHandler(os.path.join(dir_path, "output.log"),
+                                  delay=True)
+    handler.setLevel(liforganiser._file_handler.level)
+    handler.setFormatter(liforganiser._file_handler.formatter)
+    root_logger.addHandler(handler)
+
+
+def _peak_rss_mib():
+    # ru_maxrss is in KiB on Linux but in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def _organise_scenario(src, dst, chapters, lessons, workers, extract_workers):
+    from liforganiser import report
+    _log_to(os.path.dirname(dst))
+    course = _course(chapters, lessons)
+    stats = report.RunStats()
+    start_time = time.perf_counter()
+    summaries = course.organise(src, dst, _CHAPTER_PATTERN, _LESSON_PATTERN,
+                                workers=workers, stats=stats,
+                                extract_workers=extract_workers)
+    seconds = time.perf_counter() - start_time
+    if any(summary.status != "organised" for summary in summaries):
+        raise RuntimeError("not every chapter was organised: %s" %
+                           [str(summary) for summary in summaries])
+    # Written and renamed bytes both count; the benchmark times the whole run.
+    size = sum(totals[1] + totals[2] for totals in
+               stats.destinations.values())
+    files = sum(totals[0] for totals in stats.destinations.values())
+    return {"seconds": seconds, "bytes": size, "files": files,
+            "rss_mib": _peak_rss_mib()}
+
+
+def _discovery_scenario(src, dst, chapters, lessons):
+    _log_to(os.path.dirname(dst))
+    course = _course(chapters, lessons)
+    start_time = time.perf_counter()
+    plan = course.plan(src, dst, _CHAPTER_PATTERN, _LESSON_PATTERN,
+                       rescan=True)
+    seconds = time.perf_counter() - start_time
+    if any(chapter_plan.reason is not None for chapter_plan in plan.chapters):
+        raise RuntimeError("not every chapter was planned: %s" % plan)
+    return {"seconds": seconds,
+            "bytes": sum(chapter_plan.size for chapter_plan in
+                         plan.chapters),
+            "files": sum(len(chapter_plan.files) for chapter_plan in
+                         plan.chapters),
+            "rss_mib": _peak_rss_mib()}
+
+
+class _Handler(server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        match = re.match(r"/Course/(\d+)/(default|TheBigList)\.aspx$",
+                         self.path)
+        path = match and os.path.join(_FIXTURES_DIR_PATH, "%s_%s.html" % (
+            match.group(1), "course" if match.group(2) == "default" else
+            "biglist"))
+        if path is None or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as fp:
+            body = fp.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _from_url_scenario(work_path, repeats):
+    import liforganiser
+    from liforganiser import catalogue
+    from liforganiser import report
+    from liforganiser import scrape
+    liforganiser._stderr_handler.setLevel(logging.CRITICAL)
+    _log_to(work_path)
+    # Keep the scraped pages and course data out of the real cache and
+    # catalogue.
+    catalogue._DB_PATH = os.path.join(work_path, "catalogue.sqlite3")
+    scrape._CACHE_DIR_PATH = os.path.join(work_path, "html_cache")
+    httpd = server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    liforganiser._COURSE_URL_FORMAT = ("http://127.0.0.1:%s/Course/%%s/"
+                                       "default.aspx" % httpd.server_port)
+    course_ids = sorted(int(file_name.split("_")[0]) for file_name in
+                        os.listdir(_FIXTURES_DIR_PATH) if
+                        file_name.endswith("_course.html"))
+    size = sum(os.path.getsize(os.path.join(_FIXTURES_DIR_PATH, file_name))
+               for file_name in os.listdir(_FIXTURES_DIR_PATH) if
+               file_name.endswith(".html"))
+    session = scrape.new_session()
+    stats = report.RunStats()
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        for course_id in course_ids:
+            liforganiser.Course.from_url(course_id, logging.CRITICAL,
+                                         session, stats=stats)
+    seconds = time.perf_counter() - start_time
+    httpd.shutdown()
+    return {"seconds": seconds, "bytes": size * repeats,
+            "files": len(course_ids) * repeats * 2,
+            "rss_mib": _peak_rss_mib()}
+
+
+def _run(function, *args):
+    # A spawned process starts from nothing, so its peak RSS is the
+    # scenario's alone.
+    context = multiprocessing.get_context("spawn")
+    with futures.ProcessPoolExecutor(1, context) as executor:
+        return executor.submit(function, *args).result()
+
+
+def _cross_device_root(root, path):
+    if path is None:
+        path = "/dev/shm"
+    if not os.path.isdir(path) or os.stat(path).st_dev == os.stat(
+            root).st_dev:
+        return None
+    return tempfile.mkdtemp(prefix="liforganiser-bench-", dir=path)
+
+
+def _settings(args):
+    settings = {option: getattr(args, option) for option in
+                _WORKLOAD_OPTIONS}
+    settings.update(python=platform.python_version(),
+                    platform=platform.platform(), cpus=os.cpu_count())
+    return settings
+
+
+def _check_settings(baseline, args):
+    # Return the reason the baseline cannot be compared with this run, or
+    # None, warning about differences that only make it less reliable.
+    settings = baseline.get(_SETTINGS_KEY)
+    if settings is None:
+        return ("the baseline does not record the options it was made with; "
+                "make it again with --save")
+    current = _settings(args)
+    differences = ["%s %s here but %s in the baseline" % (
+        option, current[option], settings.get(option)) for option in
+        _WORKLOAD_OPTIONS if current[option] != settings.get(option)]
+    if differences:
+        return "the baseline was made with other options: %s" % (
+            "; ".join(differences))
+    for key in ("python", "platform", "cpus"):
+        if current[key] != settings.get(key):
+            sys.stderr.write("The baseline was made with %s %s rather than "
+                             "%s, so the comparison may not be "
+                             "meaningful.\n" % (key, settings.get(key),
+                                                current[key]))
+    return None
+
+
+def _check(name, result, baseline, args):
+    # Return a list of the reasons the result is a regression.
+    failures = []
+    mbps = result["bytes"] / result["seconds"] / 1e6
+    if args.min_mbps is not None and mbps < args.min_mbps:
+        failures.append("%.1f MB/s is below %.1f MB/s" % (mbps,
+                                                          args.min_mbps))
+    if args.max_rss is not None and result["rss_mib"] > args.max_rss:
+        failures.append("%.1f MiB peak RSS exceeds %.1f MiB" %
+                        (result["rss_mib"], args.max_rss))
+    previous = baseline.get(name)
+    if previous is not None:
+        if mbps < previous["mbps"] * (1 - args.tolerance):
+            failures.append("%.1f MB/s is more than %d%% below the baseline "
+                            "of %.1f MB/s" % (mbps, args.tolerance * 100,
+                                              previous["mbps"]))
+        if result["rss_mib"] > previous["rss_mib"] * (1 + args.tolerance):
+            failures.append("%.1f MiB peak RSS is more than %d%% above the "
+                            "baseline of %.1f MiB" %
+                            (result["rss_mib"], args.tolerance * 100,
+                             previous["rss_mib"]))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark organising "
+                                     "synthetic course chapters and scraping "
+                                     "a local stand-in for LearnItFirst.com.")
+    parser.add_argument("-c", "--chapters", help="the number of chapters "
+                        "generated", default=8, type=int)
+    parser.add_argument("-l", "--lessons", help="the number of lessons per "
+                        "chapter", default=20, type=int)
+    parser.add_argument("-s", "--size", help="the size of each AVI file in "
+                        "KiB; each PDF file is a tenth of this", default=2048,
+                        type=int)
+    parser.add_argument("-d", "--deflate", help="deflate zip members rather "
+                        "than storing them", action="store_true")
+    parser.add_argument("-w", "--workers", help="the number of chapters "
+                        "organised concurrently", default=1, type=int)
+    parser.add_argument("-z", "--extractworkers", help="the number of threads "
+                        "inflating each chapter zip of 64 MiB or more",
+                        default=1, type=int)
+    parser.add_argument("-t", "--tmpdir", help="the directory in which the "
+                        "source and same-device destination are created",
+                        default=None)
+    parser.add_argument("-x", "--crossdir", help="a directory on another "
+                        "device, e.g. a loopback mount, used as the "
+                        "cross-device destination (default /dev/shm)",
+                        default=None)
+    parser.add_argument("-n", "--entries", help="the number of unrelated "
+                        "entries alongside the chapters in the discovery "
+                        "scenario's source directory", default=20000,
+                        type=int)
+    parser.add_argument("-r", "--repeats", help="the number of times each "
+                        "fixture course is scraped", default=20, type=int)
+    parser.add_argument("-b", "--baseline", help="a JSON file of earlier "
+                        "results to compare against", default=None)
+    parser.add_argument("--save", help="write the results to the baseline "
+                        "file rather than comparing against it",
+                        action="store_true")
+    parser.add_argument("--tolerance", help="the fraction by which a result "
+                        "may be worse than the baseline", default=0.2,
+                        type=float)
+    parser.add_argument("--min-mbps", help="fail any scenario slower than "
+                        "this many MB/s", default=None, type=float)
+    parser.add_argument("--max-rss", help="fail any scenario whose peak RSS "
+                        "exceeds this many MiB", default=None, type=float)
+    args = parser.parse_args()
+    compression = zipfile.ZIP_DEFLATED if args.deflate else zipfile.ZIP_STORED
+    baseline = {}
+    if args.baseline is not None and not args.save and os.path.isfile(
+            args.baseline):
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+        reason = _check_settings(baseline, args)
+        if reason is not None:
+            parser.error("cannot compare against %s; %s" % (args.baseline,
+                                                            reason))
+    root = tempfile.mkdtemp(prefix="liforganiser-bench-", dir=args.tmpdir)
+    cross_root = _cross_device_root(root, args.crossdir)
+    if cross_root is None:
+        sys.stderr.write("No directory on another device is available; the "
+                         "cross-device scenarios will be skipped.\n")
+    scenarios = []
+    for as_zip in (True, False):
+        for cross_device in (False, True):
+            if cross_device and cross_root is None:
+                continue
+            scenarios.append(("%s %s-device" % ("zip" if as_zip else "dir",
+                                                "cross" if cross_device else
+                                                "same"), as_zip, cross_device))
+    results = {}
+    try:
+        for name, as_zip, cross_device in scenarios:
+            src = os.path.join(root, "src")
+            dst = os.path.join(cross_root if cross_device else root, "dst")
+            os.makedirs(src)
+            os.makedirs(dst)
+            generate(src, args.chapters, args.lessons, args.size * 1024,
+                     as_zip, compression)
+            results[name] = _run(_organise_scenario, src, dst, args.chapters,
+                                 args.lessons, args.workers,
+                                 args.extractworkers)
+            shutil.rmtree(src)
+            shutil.rmtree(dst)
+        src = os.path.join(root, "src")
+        dst = os.path.join(root, "dst")
+        os.makedirs(src)
+        os.makedirs(dst)
+        generate(src, args.chapters, args.lessons, args.size * 1024, False,
+                 compression)
+        pad(src, args.entries)
+        results["discovery"] = _run(_discovery_scenario, src, dst,
+                                    args.chapters, args.lessons)
+        shutil.rmtree(src)
+        shutil.rmtree(dst)
+        work_path = os.path.join(root, "from_url")
+        os.makedirs(work_path)
+        results["from_url"] = _run(_from_url_scenario, work_path,
+                                   args.repeats)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        if cross_root is not None:
+            shutil.rmtree(cross_root, ignore_errors=True)
+    sys.stdout.write("%-20s %7s %10s %9s %9s %9s\n" % (
+        "scenario", "files", "MB", "seconds", "MB/s", "RSS MiB"))
+    failed = False
+    for name, result in results.items():
+        result["mbps"] = result["bytes"] / result["seconds"] / 1e6
+        sys.stdout.write("%-20s %7s %10.1f %9.3f %9.1f %9.1f\n" % (
+            name, result["files"], result["bytes"] / 1e6, result["seconds"],
+            result["mbps"], result["rss_mib"]))
+        for failure in _check(name, result, baseline, args):
+            sys.stderr.write("REGRESSION in %s: %s.\n" % (name, failure))
+            failed = True
+    if args.save and args.baseline is not None:
+        saved = {name: {"mbps": result["mbps"],
+                        "rss_mib": result["rss_mib"]} for name, result in
+                 results.items()}
+        saved[_SETTINGS_KEY] = _settings(args)
+        with open(args.baseline, "w") as fp:
+            json.dump(saved, fp, indent=4, sort_keys=True)
+        sys.stdout.write("Saved the results to %s.\n" % args.baseline)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+"""Benchmarks the lxml and bs4 backends of liforganiser.scrape against saved
+HTML fixtures and checks that both produce identical course data.
+
+The fixtures are the pages in benchmarks/fixtures (see make_fixtures.py) plus
+any course pages, and their TheBigList.aspx pages, saved in
+liforganiser/html_cache by a real scrape.
+
+The TheBigList.aspx pages in benchmarks/fixtures/malformed are not timed but
+are parsed by both backends, which must fail in the same way, with a
+ValueError, so that Course.prefetch skips such a page rather than stopping.
+"""
+
+from urllib import parse
+import argparse
+import os
+import sys
+import time
+
+_BENCHMARKS_DIR_PATH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_BENCHMARKS_DIR_PATH, os.pardir))
+
+from liforganiser import scrape  # noqa: E402
+import liforganiser  # noqa: E402
+
+
+_FIXTURES_DIR_PATH = os.path.join(_BENCHMARKS_DIR_PATH, "fixtures")
+_MALFORMED_DIR_PATH = os.path.join(_FIXTURES_DIR_PATH, "malformed")
+
+
+def _fixtures():
+    # Yield (name, course page, TheBigList.aspx page) tuples.
+    names = sorted(file_name[:-len("_course.html")] for file_name in
+                   os.listdir(_FIXTURES_DIR_PATH) if
+                   file_name.endswith("_course.html"))
+    for name in names:
+        pages = []
+        for suffix in ("course", "biglist"):
+            with open(os.path.join(_FIXTURES_DIR_PATH, "%s_%s.html" %
+                                   (name, suffix))) as fp:
+                pages.append(fp.read())
+        yield ("fixture %s" % name,) + tuple(pages)
+    cache = scrape.PageCache()
+    for course_id in range(100, 1000):
+        url = liforganiser._COURSE_URL_FORMAT % course_id
+        course_page = cache.get(url)
+        if course_page is None:
+            continue
+        href = scrape.parse_course_page(course_page[0])[1]
+        big_list_page = href and cache.get(parse.urljoin(url, href))
+        if big_list_page:
+            yield "cached %s" % course_id, course_page[0], big_list_page[0]
+
+
+def _outcome(backend, big_list_page):
+    # Return the course data parsed from a page, or the type and message of
+    # the exception raised instead.
+    try:
+        return scrape.parse_big_list(big_list_page, backend)
+    except Exception as error:
+        return type(error), str(error)
+
+
+def _check_malformed():
+    # Return the names of the malformed fixtures on which the backends
+    # disagree or fail with anything but a ValueError.
+    failures = []
+    for file_name in sorted(os.listdir(_MALFORMED_DIR_PATH)):
+        with open(os.path.join(_MALFORMED_DIR_PATH, file_name)) as fp:
+            big_list_page = fp.read()
+        bs4_outcome = _outcome("bs4", big_list_page)
+        lxml_outcome = _outcome("lxml", big_list_page)
+        if bs4_outcome != lxml_outcome or bs4_outcome[0] is not ValueError:
+            failures.append("%s (bs4: %s; lxml: %s)" % (
+                file_name, bs4_outcome, lxml_outcome))
+    return failures
+
+
+def _time(backend, course_page, big_list_page, repeats):
+    start_time = time.perf_counter()
+    for _ in range(repeats):
+        result = (scrape.parse_course_page(course_page, backend),
+                  scrape.parse_big_list(big_list_page, backend))
+    return (time.perf_counter() - start_time) / repeats, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrape "
+                                     "parser backends against saved HTML "
+                                     "fixtures.")
+    parser.add_argument("-r", "--repeats", help="the number of times each "
+                        "fixture is parsed per backend", default=20, type=int)
+    args = parser.parse_args()
+    failures = _check_malformed()
+    if failures:
+        sys.stderr.write("The backends disagree on malformed pages: %s.\n" %
+                         "; ".join(failures))
+        return 1
+    sys.stdout.write("%-16s %10s %10s %8s\n" % ("pages", "bs4 ms", "lxml ms",
+                                                "speedup"))
+    for name, course_page, big_list_page in _fixtures():
+        bs4_seconds, bs4_result = _time("bs4", course_page, big_list_page,
+                                        args.repeats)
+        lxml_seconds, lxml_result = _time("lxml", course_page,
+                                          big_list_page, args.repeats)
+        if bs4_result != lxml_result:
+            sys.stderr.write("The backends disagree on %s.\n" % name)
+            return 1
+        sys.stdout.write("%-16s %10.2f %10.2f %7.1fx\n" %
+                         (name, bs4_seconds * 1000, lxml_seconds * 1000,
+                          bs4_seconds / lxml_seconds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""Renders saved HTML fixtures of the course and TheBigList.aspx pages from
+the course data dumps in liforganiser/course_data, laid out in the structure
+that liforganiser.scrape expects, so that the parsers can be benchmarked
+without touching LearnItFirst.com.
+
+Pages saved in liforganiser/html_cache by a real scrape are better fixtures
+still; bench_parser.py picks them up automatically.
+"""
+
+from xml.sax import saxutils
+import json
+import os
+import sys
+
+
+_BENCHMARKS_DIR_PATH = os.path.dirname(os.path.abspath(__file__))
+_FIXTURES_DIR_PATH = os.path.join(_BENCHMARKS_DIR_PATH, "fixtures")
+_JSON_DIR_PATH = os.path.join(_BENCHMARKS_DIR_PATH, os.pardir, "liforganiser",
+                              "course_data")
+# The real pages carry a large amount of navigation around the data, which
+# is exactly what a full-document parse pays for.
+_CHROME = "".join("<li><a href=\"/Course/%s/default.aspx\">Course %s</a></li>"
+                  % (course_id, course_id) for course_id in range(100, 400))
+
+
+def _raw(name):
+    # Undo the "NN - " prefix that Course._transform_name adds.
+    return saxutils.escape(name.split(" - ", 1)[-1])
+
+
+def render(course):
+    course_page = ("<html><head><title>LearnItFirst.com</title></head><body>"
+                   "<ul class=\"nav\">%s</ul><h1>\n    %s\n</h1><p>"
+                   "<a href=\"/Course/%s/TheBigList.aspx\">\n    View the "
+                   "videos in this course\n</a></p><ul>%s</ul></body></html>" %
+                   (_CHROME, _raw(course["title"]), course["course_id"],
+                    _CHROME))
+    parts = ["<html><head><title>TheBigList</title></head><body>"
+             "<ul class=\"nav\">%s</ul>" % _CHROME]
+    for chapter_num in sorted(course["chapters"], key=int):
+        chapter = course["chapters"][chapter_num]
+        parts.append("<div class=\"chapterTitle clearfix\"><h2><b>Chapter "
+                     "%s:</b> <a href=\"#\">%s</a></h2></div><div>" %
+                     (chapter_num, _raw(chapter["name"])))
+        for lesson_num in sorted(chapter["lessons"], key=int):
+            parts.append("<div class=\"chapterBorder\"><div>%s.%s</div><div>"
+                         "<a href=\"#\">%s</a></div><div>12:34</div></div>" %
+                         (chapter_num, lesson_num,
+                          _raw(chapter["lessons"][lesson_num])))
+        parts.append("</div>")
+    parts.append("<ul>%s</ul></body></html>" % _CHROME)
+    return course_page, "".join(parts)
+
+
+def main():
+    os.makedirs(_FIXTURES_DIR_PATH, exist_ok=True)
+    for file_name in sorted(os.listdir(_JSON_DIR_PATH)):
+        # course_data also holds the catalogue; only the JSON files are
+        # course data.
+        if os.path.splitext(file_name)[1] != os.extsep + "json":
+            continue
+        with open(os.path.join(_JSON_DIR_PATH, file_name)) as fp:
+            course = json.load(fp)
+        course_id = course["course_id"]
+        for suffix, page in zip(("course", "biglist"), render(course)):
+            path = os.path.join(_FIXTURES_DIR_PATH, "%s_%s.html" %
+                                (course_id, suffix))
+            with open(path, "w") as fp:
+                fp.write(page)
+            sys.stdout.write("Wrote %s\n" % path)
+
+
+if __name__ == "__main__":
+    main()
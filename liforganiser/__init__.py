@@ -4,34 +4,65 @@
 LearnItFirst.com and then organise, move and rename pre-downloaded course
 chapters accordingly.
 
-The package exports no further modules but it contains an empty course_data
-folder which will be populated with JSON files containing course data dumps
-for ease of future access.
+The package also contains the following modules and folder:
+module catalogue -- Stores course data in a single SQLite catalogue.
+module encode -- Transcodes organised AVI lessons into MP4 files.
+module index -- Remembers the outcome of each source entry.
+module jobs -- Queues chapters for workers on any number of hosts.
+module manifest -- Records the size and checksum of each file transferred.
+module report -- Collects timings and progress; pass its RunStats or
+    Progress to from_url(), organise() and the like.
+module scrape -- Makes the HTTP requests to LearnItFirst.com.
+module store -- Deduplicates identical files across chapters and courses.
+module transfer -- Moves and writes files into their destinations.
+module watch -- Notices chapters arriving in a source directory.
+folder course_data -- Populated with the catalogue of course data dumps for
+    ease of future access.
 
-This module exports the following two names only:
+This module exports the following six names only:
 Exception LearnItFirstError -- General error class, predominantly pertaining
     to issues encountered when scraping data from LearnItFirst.com.
 class Course -- The one and only access point for scraping data and organising
     pre-downloaded course chapters.
+function organise_many -- Organise the chapters of several courses from
+    within a single scan of a source directory.
+function watch_many -- Organise the chapters of several courses as they
+    finish arriving in a source directory.
+function enqueue_many -- Add the chapters of several courses found in a
+    source directory to a job queue shared by any number of workers.
+function work -- Claim, organise and acknowledge chapters from a job queue.
 
 View each name's docstring for more verbose information.
 
-To see prettified help information on command line usage, please call the
-script without arguments.
+To see prettified help information on command line usage, please call
+liforganiser, or python -m liforganiser, with -h.
 """
 
+from concurrent import futures
 from urllib import parse
 import argparse
+import collections.abc
+import functools
 import json
 import logging
 import os
+import posixpath
 import re
-import shutil
-import stat
+import socket
+import sys
+import threading
+import time
 import zipfile
 
-import bs4
-import requests
+from liforganiser import catalogue
+from liforganiser import encode
+from liforganiser import index
+from liforganiser import jobs
+from liforganiser import manifest
+from liforganiser import report
+from liforganiser import store
+from liforganiser import transfer
+from liforganiser import watch
 
 
 # Linux is pretty lenient compared with Windows and only seems to forbid the
@@ -42,22 +73,48 @@ _CHAR_REPLACEMENTS = {
 }
 _PACKAGE_DIR = os.path.dirname(__file__)
 _JSON_DIR_PATH = os.path.join(_PACKAGE_DIR, "course_data")
-if not os.path.isdir(_JSON_DIR_PATH):
-    os.mkdir(_JSON_DIR_PATH)
 _JSON_PATH_FORMAT = os.path.join(_JSON_DIR_PATH, "%s" + os.extsep + "json")
 # Declare variable for readable line length.
 _log_path = os.path.join(_PACKAGE_DIR, "output" + os.path.extsep +
                          "log")
 _format = "%(asctime)s (%(levelname)s) -> %(message)s"
-logging.basicConfig(filename=_log_path, format=_format,
+# The log file is only opened once the first record is written so that
+# importing the package touches nothing on disk.
+_file_handler = logging.FileHandler(_log_path, delay=True)
+_file_handler.setLevel(logging.INFO)
+logging.basicConfig(handlers=[_file_handler], format=_format,
                     datefmt="%d/%m/%Y %H:%M:%S")
 _logger = logging.getLogger(__name__)
-_logger.setLevel(logging.DEBUG)
+# DEBUG records are only made once the console asks for them; see
+# _set_stderr_level.
+_logger.setLevel(logging.INFO)
 _stderr_handler = logging.StreamHandler()
 _stderr_handler.setFormatter(logging.Formatter(_format, "%H:%M:%S"))
 _DEFAULT_LEVEL = logging.ERROR
 _logger.addHandler(_stderr_handler)
 _ABSENT = object()
+# The hidden directory inside dst in which organise keeps its own state.
+_STATE_DIR_NAME = ".liforganiser"
+_COURSE_URL_FORMAT = "http://www.learnitfirst.com/Course/%s/default.aspx"
+# Below this size a chapter zip is inflated faster by one thread than it takes
+# to open a handle per thread.
+_PARALLEL_EXTRACT_MIN_SIZE = 64 * 1024 * 1024
+# The buffer shared among the threads inflating a chapter zip, so that their
+# peak memory is about that of a single thread.
+_PARALLEL_EXTRACT_BUFFER_SIZE = 8 * 1024 * 1024
+# The extensions of lesson files renamed after the lesson names alone.
+_LESSON_EXTS = frozenset(("avi", "pdf"))
+# A zip member path that is absolute, starts with a drive letter or climbs out
+# of its directory, once any backslashes are read as separators.
+_UNSAFE_MEMBER_PATTERN = re.compile(r"^/|^[A-Za-z]:|(?:^|/)\.\.(?:/|$)")
+
+
+def _set_stderr_level(level):
+    # The log file takes INFO and above, so the logger only lets DEBUG records
+    # through when the console shows them, and the modules' loggers inherit
+    # its level.
+    _stderr_handler.setLevel(level)
+    _logger.setLevel(min(level or logging.DEBUG, logging.INFO))
 
 
 class LearnItFirstError(Exception):
@@ -88,14 +145,28 @@ class Course(object):
     classmethod from_url -- Scrape course data from LearnItFirst.com and return
         a Course instance with this data.  Ordinarily, this would be called
         implicitly via the get() method.  Only call explicitly if you have
-        reason to believe that the existing JSON file is corrupt or out of date
-        with course data on LearnItFirst.com
+        reason to believe that the existing course data is corrupt or out of
+        date with course data on LearnItFirst.com
+    classmethod prefetch -- Scrape course data for many courses concurrently
+        from LearnItFirst.com, dumping each course as soon as it has been
+        scraped.
     classmethod get -- Return a Course object with course data for the relevant
-        course ID.  If the JSON file exists, get data from here ahead of
-        scraping LearnItFirst.com
-    method dump -- Dump course data to a JSON file inside ./course_data/
+        course ID.  If the course is catalogued, or a legacy JSON file exists,
+        get data from there ahead of scraping LearnItFirst.com
+    classmethod migrate -- Load every course from the JSON files inside
+        ./course_data/ into the catalogue.
+    method dump -- Dump course data to the catalogue inside ./course_data/
     method organise -- Organise, move and rename all relevant course chapters
         including their lessons from within a source directory.
+    method watch -- Organise course chapters as they finish arriving in a
+        source directory.
+    method plan -- Decide how all relevant course chapters within a source
+        directory would be organised, without moving anything.
+    classmethod execute -- Carry out a plan returned by plan().
+    classmethod rollback -- Undo the moves of every chapter whose organisation
+        into a destination directory was interrupted.
+    classmethod audit -- Check the files organised into a destination
+        directory against the manifests written when verifying.
     """
 
     def __init__(self, course_id, title, chapters,
@@ -108,14 +179,7 @@ class Course(object):
             # will be passed to __init__ when cls.from_url or cls.get are
             # responsible for instantiating the class.  Passed to avoid setting
             # the level of the log handler twice.
-            _stderr_handler.setLevel(stderr_level_override or _DEFAULT_LEVEL)
-
-    @classmethod
-    def _remove_readonly(cls, func, path, exc_info):
-        # shutil.rmtree fails on readonly files; this function is called when
-        # an exception is raised during the tree removal.
-        os.chmod(path, stat.S_IWRITE)
-        func(path)  # This ensures execution continues
+            _set_stderr_level(stderr_level_override or _DEFAULT_LEVEL)
 
     @classmethod
     def _transform_name(cls, num, name, course_id=None, chapter_num=None):
@@ -159,19 +223,38 @@ class Course(object):
                       stderr_level_override)
 
     @classmethod
-    def from_url(cls, course_id, stderr_level_override=None):
+    def from_url(cls, course_id, stderr_level_override=None, session=None,
+                 rate_limiter=None, offline=False, parser="lxml", stats=None):
         """Scrape course data from LearnItFirst.com and return
         a Course instance with this data.  Ordinarily, this would be called
         implicitly via the get() method.  Only call explicitly if you have
-        reason to believe that the existing JSON file is corrupt or out of date
-        with course data on LearnItFirst.com.
+        reason to believe that the existing course data is corrupt or out of
+        date with course data on LearnItFirst.com.
 
         Keyword arguments:
         course_id -- the unique ID integer (between 100 and 999) of the course
         stderr_level_override -- an integer value representing the minimum
             level of logging verbosity in accordance with logging levels.  If
             no value is passed, logging.INFO (20) will be used (default None)
+        session -- a requests.Session, as returned by scrape.new_session(),
+            through which both pages should be requested (default None)
+        rate_limiter -- a scrape.RateLimiter to wait on before each request
+            (default None)
+        offline -- whether the pages should be parsed from ./html_cache/
+            without making any request.  Every page is cached as it is
+            downloaded and is otherwise revalidated with a conditional request
+            (default False)
+        parser -- the backend used to parse both pages; "lxml" runs targeted
+            XPath queries whilst "bs4" builds full BeautifulSoup trees.  Both
+            produce identical course data (default "lxml")
+        stats -- a report.RunStats to which the time spent on HTTP requests
+            and on parsing is added (default None)
         """
+        # The scraping stack is slow to import and is not needed when course
+        # data is served from the catalogue, so it is only loaded here.
+        import bs4
+        import requests
+        from liforganiser import scrape
         # This whole function is full of nasty web scraping as the current HTML
         # structure of the website does not lead to logically systematic
         # scraping.  It will break if the TheBigList.aspx page structure is
@@ -179,17 +262,23 @@ class Course(object):
         _logger.debug("Attempting to get data for course ID, %s, by scraping "
                       "LearnItFirst.com" % course_id)
         if stderr_level_override is not _ABSENT:
-            _stderr_handler.setLevel(stderr_level_override or _DEFAULT_LEVEL)
-        headers = {"User-Agent": "Chromium/Linux"}
-        url = "http://www.learnitfirst.com/Course/%s/default.aspx" % course_id
+            _set_stderr_level(stderr_level_override or _DEFAULT_LEVEL)
+        if stats is None:
+            stats = report.RunStats()
+        url = _COURSE_URL_FORMAT % course_id
+        cache = scrape.PageCache()
         _logger.debug("Making a HTTP request with custom headers as the "
                       "website block's requests coming from a "
                       "programattic-looking User-Agent")
         try:
-            request = requests.get(url, headers=headers)
+            with stats.time("http"):
+                request = scrape.fetch(url, session, rate_limiter, cache,
+                                       offline)
         except requests.exceptions.RequestException as message:
             _logger.error("An error was encountered when making the HTTP "
                           "request; %s" % message)
+            raise LearnItFirstError("the HTTP request for course ID, %s, "
+                                    "failed; %s" % (course_id, message))
         if request.status_code == requests.codes.not_found:
             _logger.critical("The course ID, %s, does not exist on "
                              "LearnItFirst.com. An exception will be raised." %
@@ -197,60 +286,42 @@ class Course(object):
             raise LearnItFirstError("course ID, %s, does not exist on "
                                     "LearnItFirst.com" % course_id)
         try:
-            soup = bs4.BeautifulSoup(request.text, "lxml")
+            with stats.time("parse"):
+                raw_title, href = scrape.parse_course_page(request.text,
+                                                           parser)
         except bs4.FeatureNotFound as message:
             _logger.critical("The html cannot be parsed. An error was "
                              "encountered; %s" % message)
             raise bs4.FeatureNotFound(message)
-        course_title = cls._transform_name(course_id,
-                                           soup.find("h1").string.strip())
-        for link in soup.find_all("a"):
-            string = link.string
-            if string is not None:
-                if string.strip() == "View the videos in this course":
-                    url = parse.urljoin(url, link["href"])
-                    break
-        else:
+        course_title = cls._transform_name(course_id, raw_title)
+        if href is None:
             _logger.critical("The website structure or link text to the "
                              "TheBigList.aspx page has changed and the data "
                              "cannot be found. An exception will be raised.")
             raise LearnItFirstError("the website structure or link text to "
                                     "the TheBigList.aspx page has changed")
-        soup = bs4.BeautifulSoup(requests.get(url, headers=headers).text,
-                                 "lxml")
+        url = parse.urljoin(url, href)
+        try:
+            with stats.time("http"):
+                request = scrape.fetch(url, session, rate_limiter, cache,
+                                       offline)
+        except requests.exceptions.RequestException as message:
+            _logger.error("An error was encountered when making the HTTP "
+                          "request; %s" % message)
+            raise LearnItFirstError("the HTTP request for the TheBigList.aspx "
+                                    "page of course ID, %s, failed; %s" %
+                                    (course_id, message))
+        try:
+            with stats.time("parse"):
+                raw_chapters = scrape.parse_big_list(request.text, parser)
+        except ValueError as message:
+            _logger.critical("%s An exception will be raised." % message)
+            raise LearnItFirstError(str(message))
         chapters = {}
-        chapter_divs = soup.find_all("div", "chapterTitle")
-        if not chapter_divs:
-            _logger.critical("The TheBigList.aspx page has changed structure "
-                             "and chapter data cannot be scraped. An "
-                             "exception will be raised.")
-            raise LearnItFirstError("The TheBigList.aspx page has changed "
-                                    "structure and chapter data cannot be "
-                                    "scraped.")
-        for chapter_div in chapter_divs:
-            # Declare variable for readable line length.
-            string = chapter_div.h2.b.string.strip()
-            chapter_num = int(re.match(r"Chapter\s+(\d+):", string).group(1))
-            # Declare variable for readable line length.
-            raw_name = chapter_div.h2.a.string.strip()
+        for chapter_num, raw_name, raw_lessons in raw_chapters:
             chapter_name = cls._transform_name(chapter_num, raw_name)
             lessons = {}
-            # Declare variable for readable line length.
-            next_div = chapter_div.find_next_sibling("div")
-            lesson_divs = next_div.find_all("div", "chapterBorder")
-            if not lesson_divs:
-                _logger.critical("The TheBigList.aspx page has changed "
-                                 "structure and lesson data cannot be "
-                                 "scraped.  An exception will be raised.")
-                raise LearnItFirstError("The TheBigList.aspx page has changed "
-                                        "structure and lesson data cannot be "
-                                        "scraped.")
-            for lesson_div in lesson_divs:
-                # Declare variable for readable line length.
-                start_slice = len("%s." % chapter_num)
-                first_div, second_div = lesson_div.find_all("div", limit=2)
-                lesson_num = int(first_div.string.strip()[start_slice:])
-                raw_name = second_div.a.string.strip()
+            for lesson_num, raw_name in raw_lessons:
                 lesson_name = cls._transform_name(lesson_num, raw_name,
                                                   course_id, chapter_num)
                 lessons[lesson_num] = _Lesson(lesson_num, lesson_name)
@@ -262,11 +333,73 @@ class Course(object):
         course.dump()
         return course
 
+    @classmethod
+    def prefetch(cls, course_ids, concurrency=4, min_interval=0.5,
+                 refresh=False, offline=False, stderr_level_override=None,
+                 stats=None):
+        """Scrape course data for many courses concurrently from
+        LearnItFirst.com, dumping each course as soon as it has been scraped,
+        and return a dict mapping each course ID to its Course object, or to
+        None if the course could not be scraped.
+
+        Keyword arguments:
+        course_ids -- an iterable of course ID integers (between 100 and 999)
+        concurrency -- the maximum number of courses scraped at once, which is
+            also the size of the shared connection pool (default 4)
+        min_interval -- the minimum number of seconds between the start of two
+            requests to LearnItFirst.com (default 0.5)
+        refresh -- whether courses that already have course data should be
+            scraped again (default False)
+        offline -- whether courses should be re-parsed from ./html_cache/
+            without making any request.  Courses whose pages are not cached
+            are skipped.  Combine with refresh to rebuild course_data after a
+            scraper fix (default False)
+        stderr_level_override -- an integer value representing the minimum
+            level of logging verbosity in accordance with logging levels.  If
+            no value is passed, logging.INFO (20) will be used (default None)
+        stats -- as described for from_url() (default None)
+        """
+        from liforganiser import scrape
+        _set_stderr_level(stderr_level_override or _DEFAULT_LEVEL)
+        if not refresh:
+            catalogued = set(catalogue.open_catalogue().course_ids())
+            course_ids = [course_id for course_id in course_ids if course_id
+                          not in catalogued and not
+                          os.path.isfile(_JSON_PATH_FORMAT % course_id)]
+        if offline:
+            cache = scrape.PageCache()
+            course_ids = [course_id for course_id in course_ids if
+                          cache.get(_COURSE_URL_FORMAT % course_id)]
+        _logger.info("Prefetching %s courses with a concurrency of %s." %
+                     (len(course_ids), concurrency))
+        session = scrape.new_session(concurrency)
+        rate_limiter = scrape.RateLimiter(min_interval)
+        courses = {}
+        with futures.ThreadPoolExecutor(concurrency) as executor:
+            pending = {executor.submit(cls.from_url, course_id, _ABSENT,
+                                       session, rate_limiter, offline,
+                                       stats=stats): course_id for course_id
+                       in course_ids}
+            for future in futures.as_completed(pending):
+                course_id = pending[future]
+                try:
+                    courses[course_id] = future.result()
+                except (LearnItFirstError, AttributeError, TypeError,
+                        ValueError) as message:
+                    # Most IDs in the range do not exist and the structure of
+                    # some course pages defeats the scraper; neither should
+                    # stop the other courses from being fetched.
+                    _logger.warning("Course ID, %s, could not be prefetched; "
+                                    "%s" % (course_id, message))
+                    courses[course_id] = None
+        session.close()
+        return courses
+
     @classmethod
     def get(cls, course_id, stderr_level_override=None):
         """Return a Course object with course data for the relevant
-        course ID.  If the JSON file exists, get data from here ahead of
-        scraping LearnItFirst.com.
+        course ID.  If the course is catalogued, or a legacy JSON file exists,
+        get data from there ahead of scraping LearnItFirst.com.
 
         Keyword arguments:
         course_id -- the unique ID integer (between 100 and 999) of the course
@@ -274,7 +407,12 @@ class Course(object):
             level of logging verbosity in accordance with logging levels.  If
             no value is passed, logging.INFO (20) will be used (default None)
         """
-        _stderr_handler.setLevel(stderr_level_override or _DEFAULT_LEVEL)
+        _set_stderr_level(stderr_level_override or _DEFAULT_LEVEL)
+        _logger.debug("Searching the catalogue for data for the course ID, "
+                      "%s." % course_id)
+        result = cls._from_catalogue(course_id)
+        if result is not None:
+            return result
         _logger.debug("Searching for an existing JSON file for data for the "
                       "course ID, %s." % course_id)
         json_file_path = _JSON_PATH_FORMAT % course_id
@@ -282,35 +420,75 @@ class Course(object):
             _logger.debug("Existing JSON file found at %s" % json_file_path)
             result = cls._from_json(course_id, _ABSENT)
             if result is not None:
+                # Migrate the course so that the JSON file is not parsed
+                # again.
+                result.dump()
                 return result
         course = cls.from_url(course_id, _ABSENT)
         return course
 
+    @classmethod
+    def _from_catalogue(cls, course_id):
+        _catalogue = catalogue.open_catalogue()
+        result = _catalogue.course(course_id)
+        if result is None:
+            return None
+        title, chapter_names = result
+        _logger.info("Data for course ID, %s, was successfully loaded "
+                     "from the catalogue" % course_id)
+        return Course(course_id, title, _LazyChapters(_catalogue.path,
+                                                      course_id,
+                                                      chapter_names), _ABSENT)
+
+    @classmethod
+    def migrate(cls, stderr_level_override=None):
+        """Load every course from the JSON files inside ./course_data/ into
+        the catalogue and return a list of the migrated course IDs.
+
+        Keyword arguments:
+        stderr_level_override -- an integer value representing the minimum
+            level of logging verbosity in accordance with logging levels.  If
+            no value is passed, logging.INFO (20) will be used (default None)
+        """
+        _set_stderr_level(stderr_level_override or _DEFAULT_LEVEL)
+        course_ids = []
+        if not os.path.isdir(_JSON_DIR_PATH):
+            return course_ids
+        for file_name in sorted(os.listdir(_JSON_DIR_PATH)):
+            root, ext = os.path.splitext(file_name)
+            if ext != os.extsep + "json" or not root.isdigit():
+                continue
+            course = cls._from_json(int(root), _ABSENT)
+            if course is not None:
+                course.dump()
+                course_ids.append(course.course_id)
+        _logger.info("Migrated %s courses into the catalogue." %
+                     len(course_ids))
+        return course_ids
+
     def dump(self):
-        """Dump course data to a JSON file inside ./course_data/"""
-        course = {
-            "course_id": self.course_id,
-            "title": self.title,
-            "chapters": {}
-        }
+        """Dump course data to the catalogue inside ./course_data/"""
+        chapters = {}
         for chapter_num in self.chapters:
             chapter = self.chapters[chapter_num]
-            course["chapters"][chapter.num] = {
-                "name": chapter.name,
-                "lessons": {lesson_num: lesson_data.name for lesson_num,
-                            lesson_data in chapter.lessons.items()}
-            }
-        with open(_JSON_PATH_FORMAT % self.course_id, "w+") as fp:
-            _logger.debug("Dumping the data into a JSON file so that it can "
-                          "be accessed at a later time quickly and without "
-                          "need to scrape LearnItFirst.com, saving time and "
-                          "unnecessary requests.")
-            json.dump(course, fp)
+            chapters[chapter.num] = (chapter.name, {
+                lesson_num: lesson_data.name for lesson_num, lesson_data in
+                chapter.lessons.items()})
+        _logger.debug("Dumping the data into the catalogue so that it can be "
+                      "accessed at a later time quickly and without need to "
+                      "scrape LearnItFirst.com, saving time and unnecessary "
+                      "requests.")
+        catalogue.open_catalogue().write(self.course_id, self.title, chapters)
 
     def organise(self, src, dst, chapter_pattern, lesson_pattern, avi_dst=None,
-                 pdf_dst=None, completed_prefix=None, ignored_exts=("html",)):
+                 pdf_dst=None, completed_prefix=None, ignored_exts=("html",),
+                 workers=1, use_processes=False, journal=True, rescan=False,
+                 encoder=None, stats=None, verify=False, dedup=False,
+                 extract_workers=1, device_limits=None, progress=None):
         """Organise, move and rename all relevant course chapters including
-        their lessons from within a source directory.
+        their lessons from within a source directory and return a list of
+        per-chapter summaries, ordered by chapter number.  This is the
+        equivalent of passing the result of plan() to execute().
 
         Keyword arguments:
         src -- the full path to the source directory containing the course
@@ -333,161 +511,589 @@ class Course(object):
         ignored_exts -- an iterable containing extension names (without the
             seperator) that should be ignored when renaming and moving files
             (default ("html", ))
+        workers -- the number of chapters to extract, validate and move
+            concurrently (default 1)
+        use_processes -- whether the workers should be processes rather than
+            threads.  Processes avoid contention on the GIL when extracting
+            zip files but cost more to start (default False)
+        journal -- whether each chapter's planned and completed moves should
+            be journaled inside dst/.liforganiser/ so that a chapter
+            interrupted part way through is resumed, rather than skipped, the
+            next time it is organised.  A chapter journaled by an earlier,
+            interrupted call is still resumed when this is False, and its
+            journal removed once it completes.  See rollback() (default True)
+        rescan -- whether entries in src should be examined even if they are
+            unchanged since an earlier call recorded them as organised,
+            skipped or mismatched in dst/.liforganiser/index.json.  The index
+            makes completed_prefix unnecessary for avoiding re-processing
+            (default False)
+        encoder -- an encode.Encoder to which each AVI file is submitted as
+            soon as it has been moved, so that encoding runs alongside
+            organising rather than after it.  The caller remains responsible
+            for closing the encoder (default None)
+        stats -- a report.RunStats to which the time spent opening zip
+            files, walking, validating, extracting, moving and cleaning up is
+            added, along with the files and bytes transferred to each
+            destination.  Logging in the per-file loops is formatted lazily,
+            so collecting stats is the cheap way to see where time goes
+            (default None)
+        verify -- whether the size and CRC-32 of each file should be recorded
+            in a per-course manifest, dst/.liforganiser/manifest/cNNN.manifest,
+            for audit().  The CRC-32 of a zip member is checked against the
+            zip file as it is decompressed and a copy across devices is
+            checksummed as it is made, so no file is read twice.  A file
+            renamed on its own device is recorded by size alone (default
+            False)
+        dedup -- whether files that keep their original name, such as
+            exercise databases and sample scripts, should be stored once in
+            dst/.liforganiser/store/ and linked to from every chapter and
+            course that contains them.  A file is only hashed if a stored file
+            has the same size, and an identical file is linked without its
+            data being written.  Links are reflinks where the file system
+            supports them and hard links otherwise, in which case editing one
+            copy edits them all; a stored file that has changed since it was
+            stored is discarded rather than linked to.  Alternatively, the
+            full path to a store directory on the same device as the files,
+            e.g. one outside a Dropbox folder, whose sync does not preserve
+            hard links (default False)
+        extract_workers -- the number of threads among which the members of
+            each chapter zip of 64 MiB or more are shared, each inflating its
+            share through its own handle on the zip file.  The threads split
+            one 8 MiB buffer, down to 1 MiB each, so that memory stays about
+            that of a single thread.  zlib releases the GIL whilst inflating,
+            so this also helps when use_processes is set, and a course of a
+            few huge chapter zips can use every core (default 1)
+        device_limits -- a dict mapping the path of a directory to a
+            (concurrency, bytes_per_second) tuple which caps the transfers to
+            the device that the directory is on, either of which may be None
+            for no cap.  Each chapter's files are then queued by the device
+            they are written to, and each device's queue is drained by its
+            own threads, up to its concurrency (extract_workers by default)
+            across all chapters, so that a fast device is not held up by a
+            slow one and a bulk copy to avi_dst can be kept from saturating a
+            disk that other services share.  Renames and links write no data
+            and so use no bandwidth.  When use_processes is set, each worker
+            process is given its share of each cap (default None)
+        progress -- a report.Progress to which the files and bytes expected
+            are added once the plan is made, and the files and bytes done are
+            added per chapter, in the "extract", "move" and "dedup" stages, as
+            each buffer is written.  A worker process cannot reach it, so a
+            chapter organised by one is added once it is complete.  Pass the
+            same Progress to the encoder to follow encoding too (default
+            None)
         """
-        if not os.path.isdir(src):
-            _logger.critical("Invalid or non-existent source directory, %s." %
-                             src)
-            raise OSError("invalid / non-existent source directory, %s" % src)
-        if not os.path.isdir(dst):
-            _logger.critical("Invalid or non-existent destination directory, "
-                             "%s." % dst)
-            raise OSError("invalid / non-existent destination directory, %s" %
-                          dst)
-        if avi_dst is None:
-            avi_dst = dst
-        elif not os.path.isdir(avi_dst):
-            _logger.critical("Invalid or non-existent AVI destination "
-                             "directory, %s." % avi_dst)
-            raise OSError("invalid / non-existent AVI destination directory, "
-                          "%s" % avi_dst)
-        if pdf_dst is None:
-            pdf_dst = dst
-        elif not os.path.isdir(pdf_dst):
-            _logger.critical("Invalid or non-existent PDF destination "
-                             "directory, %s." % pdf_dst)
-            raise OSError("invalid / non-existent PDF destination directory, "
-                          "%s" % pdf_dst)
-        temp_dir_path = os.path.join(src, ".temp")
-        _logger.debug("Searching for valid chapter directories for course ID, "
-                      "%s." % self.course_id)
-        for name in os.listdir(src):
-            original_path = os.path.join(src, name)
-            chapter_match = re.match(chapter_pattern, name)
-            if not chapter_match:
+        return organise_many([(self, chapter_pattern, lesson_pattern)], src,
+                             dst, avi_dst, pdf_dst, completed_prefix,
+                             ignored_exts, workers, use_processes, journal,
+                             rescan, encoder, stats, verify, dedup,
+                             extract_workers, device_limits,
+                             progress)[self.course_id]
+
+    @classmethod
+    def rollback(cls, dst, stderr_level_override=None):
+        """Undo the moves of every chapter whose organisation into a
+        destination directory was interrupted, as recorded by its journal, and
+        return a list of (course_id, chapter_num) tuples for the chapters
+        rolled back.
+
+        Keyword arguments:
+        dst -- the full path to the destination directory that was passed to
+            organise()
+        stderr_level_override -- an integer value representing the minimum
+            level of logging verbosity in accordance with logging levels.  If
+            no value is passed, logging.INFO (20) will be used (default None)
+        """
+        _set_stderr_level(stderr_level_override or _DEFAULT_LEVEL)
+        journal_dir_path = os.path.join(dst, _STATE_DIR_NAME, "journal")
+        if not os.path.isdir(journal_dir_path):
+            return []
+        rolled_back = []
+        for file_name in sorted(os.listdir(journal_dir_path)):
+            journal_path = os.path.join(journal_dir_path, file_name)
+            chapter_plan = _ChapterPlan.from_journal(journal_path, False)
+            if chapter_plan is None:
                 continue
-            _logger.debug("A valid chapter directory has been found at %s." %
-                          original_path)
-            chapter_num = int(chapter_match.group(1))
-            if zipfile.is_zipfile(original_path):
-                # Whilst it may seem unnecessary to check the existence of the
-                # temporary directory for each valid chapter found, it is
-                # necessary as extraction can take a long time and it is not
-                # incomprehensible for the user to delete the directory during
-                # this time.
-                if not os.path.isdir(temp_dir_path):
-                    _logger.info("Temporary directory being created for "
-                                 "extracted zipfiles, %s." % temp_dir_path)
-                    os.mkdir(temp_dir_path)
-                path = os.path.join(temp_dir_path, name)
-                _logger.info("Chapter number, %s, was found to be a zipfile "
-                             "and is being extracted. This may take a "
-                             "while..." % chapter_num)
-                zipfile.ZipFile(original_path).extractall(path)
-            elif os.path.isfile(original_path):
+            _logger.info("Rolling back chapter number, %s, of course ID, %s." %
+                         (chapter_plan.num, chapter_plan.course_id))
+            chapter_plan.rollback()
+            rolled_back.append((chapter_plan.course_id, chapter_plan.num))
+        return rolled_back
+
+    @classmethod
+    def audit(cls, dst, stderr_level_override=None):
+        """Check every file organised into a destination directory with
+        verify against the size and CRC-32 recorded in its course's manifest,
+        reading only the destination, and return a list of (path, problem)
+        tuples for the files that are missing or no longer match.
+
+        Keyword arguments:
+        dst -- the full path to the destination directory that was passed to
+            organise()
+        stderr_level_override -- an integer value representing the minimum
+            level of logging verbosity in accordance with logging levels.  If
+            no value is passed, logging.INFO (20) will be used (default None)
+        """
+        _set_stderr_level(stderr_level_override or _DEFAULT_LEVEL)
+        manifest_dir_path = os.path.join(dst, _STATE_DIR_NAME, "manifest")
+        if not os.path.isdir(manifest_dir_path):
+            return []
+        problems = []
+        for file_name in sorted(os.listdir(manifest_dir_path)):
+            problems.extend(manifest.Manifest(os.path.join(
+                manifest_dir_path, file_name)).audit())
+        for path, problem in problems:
+            _logger.error("%s does not match its manifest; %s." % (path,
+                                                                   problem))
+        return problems
+
+    def watch(self, src, dst, chapter_pattern, lesson_pattern, avi_dst=None,
+              pdf_dst=None, completed_prefix=None, ignored_exts=("html",),
+              workers=1, use_processes=False, journal=True, rescan=False,
+              encoder=None, settle_time=10.0, poll_interval=5.0,
+              stop_event=None, stats=None, verify=False, dedup=False,
+              extract_workers=1, device_limits=None, progress=None):
+        """Organise, move and rename course chapters as they finish arriving
+        in a source directory, until stop_event is set, and return a list of
+        per-chapter summaries, ordered by chapter number.  Chapters already
+        in src are organised first.
+
+        Keyword arguments:
+        src, dst, chapter_pattern, lesson_pattern, avi_dst, pdf_dst,
+            completed_prefix, ignored_exts, workers, use_processes, journal,
+            rescan, encoder -- as described for organise()
+        settle_time -- the number of seconds for which a chapter must be left
+            unchanged before it is considered complete.  A zip file must also
+            have a valid central directory (default 10.0)
+        poll_interval -- the maximum number of seconds between checks of src,
+            which is listed this often where inotify is unavailable (default
+            5.0)
+        stop_event -- a threading.Event which stops the watch once set.  If no
+            value is passed, the watch only stops when interrupted (default
+            None)
+        stats, verify, dedup, extract_workers, device_limits, progress -- as
+            described for organise() (default None, False, False, 1, None and
+            None)
+        """
+        return watch_many([(self, chapter_pattern, lesson_pattern)], src, dst,
+                          avi_dst, pdf_dst, completed_prefix, ignored_exts,
+                          workers, use_processes, journal, rescan, encoder,
+                          settle_time, poll_interval, stop_event, stats,
+                          verify, dedup, extract_workers, device_limits,
+                          progress)[self.course_id]
+
+    def plan(self, src, dst, chapter_pattern, lesson_pattern, avi_dst=None,
+             pdf_dst=None, ignored_exts=("html",), rescan=False, stats=None):
+        """Decide how all relevant course chapters within a source directory
+        would be organised, without moving or writing anything, and return
+        the plan so that it can be inspected and later passed to execute().
+
+        The plan's instance variables are as follows:
+        plan.chapters -- a list of chapter plans, each with the files it would
+            move (as file_path, new_file_path and size) or the reason it
+            would be skipped
+        plan.bytes_per_device -- a dict mapping the st_dev of each destination
+            device to the number of bytes that would be written to it, i.e.
+            extracted from a zip file or copied from another device.  Files
+            later linked to a stored copy by dedup are still counted
+        plan.bytes_renamed_per_device -- a dict mapping the st_dev of each
+            destination device to the number of bytes that would be renamed
+            into it from a chapter directory on the same device, which
+            writes no data
+        Converting the plan to a string lists all of the above.
+
+        Keyword arguments:
+        src, dst, chapter_pattern, lesson_pattern, avi_dst, pdf_dst,
+            ignored_exts, rescan, stats -- as described for organise()
+        """
+        return _plan_many([(self, chapter_pattern, lesson_pattern)], src, dst,
+                          avi_dst, pdf_dst, ignored_exts, rescan, stats=stats)
+
+    @classmethod
+    def execute(cls, plan, completed_prefix=None, workers=1,
+                use_processes=False, journal=True, encoder=None, stats=None,
+                verify=False, dedup=False, extract_workers=1,
+                device_limits=None, progress=None):
+        """Carry out a plan returned by plan() and return a dict mapping each
+        course ID in the plan to a list of per-chapter summaries, ordered by
+        chapter number.
+
+        Keyword arguments:
+        plan -- the plan to carry out
+        completed_prefix, workers, use_processes, journal, encoder, stats,
+            verify, dedup, extract_workers, device_limits, progress -- as
+            described for organise().  When there is more than one worker,
+            the largest chapters are started first
+        """
+        if stats is None:
+            stats = report.RunStats()
+        device_queues = None
+        if device_limits:
+            device_queues = {}
+            # Worker processes cannot share a queue, so each is given its
+            # share of the caps instead.
+            shares = workers if use_processes and workers > 1 else 1
+            for path, (concurrency, bytes_per_second) in (
+                    device_limits.items()):
+                if concurrency:
+                    concurrency = max(1, concurrency // shares)
+                limiter = None
+                if bytes_per_second:
+                    limiter = transfer.BandwidthLimiter(bytes_per_second /
+                                                        shares)
+                device_queues[os.stat(path).st_dev] = _DeviceQueue(
+                    concurrency, limiter)
+        results = {course_id: [] for course_id in plan.course_ids}
+        transfers = {}
+
+        def record(chapter_plan, summary):
+            _logger.info(summary)
+            results[chapter_plan.course_id].append(summary)
+            for stage, (count, seconds) in summary.stages.items():
+                stats.add_stage(stage, seconds, count)
+            files = {}
+            for _file in chapter_plan.files:
+                files[_file.destination] = files.get(_file.destination, 0) + 1
+            for destination, transfer_stats in summary.transfers.items():
+                stats.add_transfer(destination, files.get(destination, 0),
+                                   transfer_stats)
+                transfer.merge_stats(transfers.setdefault(
+                    destination, [0, 0, None, None]), transfer_stats)
+            if summary.checksums and chapter_plan.manifest_path is not None:
+                # Only this thread writes to the manifests, so chapters
+                # finishing on different workers cannot interleave lines.
+                manifest.Manifest(chapter_plan.manifest_path).append(
+                    summary.checksums)
+            stats.write({
+                "event": "chapter",
+                "course_id": chapter_plan.course_id,
+                "num": summary.num,
+                "path": summary.path,
+                "status": summary.status,
+                "reason": summary.reason,
+                "files": summary.files,
+                "size": summary.size,
+                "seconds": summary.seconds,
+                "stages": summary.stages,
+                "transfers": summary.transfers
+            })
+
+        chapter_plans = []
+        for chapter_plan in plan.chapters:
+            if chapter_plan.reason is None:
+                chapter_plans.append(chapter_plan)
                 continue
+            record(chapter_plan, _ChapterSummary(chapter_plan.num,
+                                                 chapter_plan.path, "skipped",
+                                                 chapter_plan.reason))
+        if progress is not None:
+            for chapter_plan in chapter_plans:
+                progress.add_total((chapter_plan.course_id, chapter_plan.num),
+                                   *_pending_totals(chapter_plan))
+        if encoder is None:
+            on_file = None
+        else:
+            def on_file(_file):
+                # Queue each AVI file as soon as it lands so that encoding
+                # overlaps with organising the rest of the plan.
+                if _file.ext == "avi":
+                    encoder.submit(_file.new_file_path)
+        if workers > 1 and len(chapter_plans) > 1:
+            if use_processes:
+                executor_class = futures.ProcessPoolExecutor
             else:
-                path = original_path
-            chapter = self.chapters[chapter_num]
-            files = []
-            contents_path = None
-            _logger.debug("Searching for valid lesson files for chapter, %s." %
-                          chapter_num)
-            for root, dir_names, file_names in os.walk(path):
-                if not file_names:
-                    continue
-                if contents_path is None:
-                    contents_path = root
-                for file_name in file_names:
-                    split_ext = os.path.splitext(file_name)
-                    if len(split_ext) > 1:
-                        ext = split_ext[1][1:].lower()
-                        if ext in ignored_exts:
-                            continue
-                    else:
-                        ext = ""
-                    file_path = os.path.join(root, file_name)
-                    dst_rel_path = os.path.join(self.title, chapter.name)
-                    if root != contents_path:
-                        # Declare variable for readable line length.
-                        rel_path = os.path.relpath(root, contents_path)
-                        dst_rel_path = os.path.join(dst_rel_path, rel_path)
-                    lesson_match = re.match(lesson_pattern, file_name)
-                    if lesson_match is not None:
-                        _logger.debug("A valid lesson file that matches the "
-                                      "file name format has been found at %s."
-                                      % file_path)
-                        num = int(lesson_match.group(1))
-                        if ext in ("avi", "pdf"):
-                            lesson = chapter.lessons.get(num)
-                            if lesson is None:
-                                _logger.error("Lesson number, %s, does not"
-                                              "exist on LearnItFirst.com. "
-                                              "This chapter will be skipped; "
-                                              "lessons cannot be renamed with "
-                                              "confidence as a missing lesson "
-                                              "file could point to a mix up "
-                                              "in the other lesson names." %
-                                              num)
-                                break
-                            name = lesson.name + os.path.extsep + ext
-                            if ext == "avi":
-                                new_file_path = os.path.join(avi_dst,
-                                                             dst_rel_path,
-                                                             name)
-                            elif ext == "pdf":
-                                new_file_path = os.path.join(pdf_dst,
-                                                             dst_rel_path,
-                                                             name)
-                        else:
-                            description = lesson_match.group(2).strip()
-                            if not description:
-                                _logger.warning("file name, %s, contains no "
-                                                "description and so renamed "
-                                                "file will be non-descript" %
-                                                file_name)
-                            name = (self._transform_name(num, description,
-                                                         self.course_id,
-                                                         chapter_num) +
-                                    os.path.extsep + ext)
-                            new_file_path = os.path.join(dst, dst_rel_path,
-                                                         name)
-                    else:
-                        _logger.debug("A file has been found that does not "
-                                      "match the lesson file name format. It "
-                                      "will still be moved but not renamed.")
-                        num = None
-                        new_file_path = os.path.join(dst, dst_rel_path,
-                                                     file_name)
-                    files.append(_File(ext, num, file_path, new_file_path))
-            if set(chapter.lessons) != set(_file.num for _file in
-                                           files if _file.ext == "avi" and
-                                           _file.num is not None):
-                _logger.error("The video contents for chapter number, %s, are "
-                              "different to what is listed on "
+                executor_class = futures.ThreadPoolExecutor
+            # Starting the largest chapters first stops a single large chapter
+            # from being left to run on its own at the end.
+            chapter_plans.sort(key=lambda chapter_plan: chapter_plan.size,
+                               reverse=True)
+            _logger.info("Organising %s chapters using %s workers." %
+                         (len(chapter_plans), workers))
+            with executor_class(workers) as executor:
+                # A worker process cannot reach the encoder, so its chapter's
+                # AVI files are queued once the whole chapter is complete.
+                pending = {executor.submit(chapter_plan.execute,
+                                           completed_prefix, journal,
+                                           None if use_processes else
+                                           on_file, verify, dedup,
+                                           extract_workers, device_queues,
+                                           None if use_processes else
+                                           progress): chapter_plan for
+                           chapter_plan in chapter_plans}
+                for future in futures.as_completed(pending):
+                    chapter_plan = pending[future]
+                    record(chapter_plan, future.result())
+                    if use_processes and on_file is not None:
+                        for _file in chapter_plan.files:
+                            on_file(_file)
+                    if use_processes and progress is not None:
+                        files, size = _pending_totals(chapter_plan)
+                        progress.add((chapter_plan.course_id,
+                                      chapter_plan.num), "extract" if
+                                     chapter_plan.is_zip else "move", size,
+                                     files)
+        else:
+            for chapter_plan in chapter_plans:
+                record(chapter_plan, chapter_plan.execute(
+                    completed_prefix, journal, on_file, verify, dedup,
+                    extract_workers, device_queues, progress))
+        for summaries in results.values():
+            summaries.sort(key=lambda summary: summary.num)
+        # The rate is taken over the wall clock time from the first write to
+        # a destination to the last, since the chapters and files being
+        # transferred concurrently would otherwise each count their time.
+        for destination, (written, renamed, first_time, last_time) in sorted(
+                transfers.items()):
+            if written:
+                _logger.info("Wrote %s bytes to %s at %.1f MB/s." % (
+                    written, destination, written / 1e6 / max(
+                        last_time - first_time, 1e-9)))
+            if renamed:
+                _logger.info("Renamed %s bytes into %s on the same device." %
+                             (renamed, destination))
+        if plan.index is not None:
+            for summaries in results.values():
+                for summary in summaries:
+                    # A chapter renamed with completed_prefix no longer
+                    # matches its chapter pattern and needs no record.
+                    if (summary.status == "organised" and
+                            os.path.exists(summary.path)):
+                        plan.index.record(os.path.abspath(summary.path),
+                                          os.stat(summary.path), "organised")
+            plan.index.save()
+        totals = {"event": "totals"}
+        totals.update(stats.as_dict())
+        stats.write(totals)
+        return results
+
+    @classmethod
+    def _scan_dir(cls, path):
+        # Yield (directory, file entries) for every directory in the tree, top
+        # down and in the order os.walk would, but keeping each file's
+        # os.DirEntry so that its path and size need no further calls.
+        dir_paths = [path]
+        while dir_paths:
+            dir_path = dir_paths.pop()
+            file_entries = []
+            sub_dir_paths = []
+            try:
+                for entry in os.scandir(dir_path):
+                    if not entry.is_dir():
+                        file_entries.append(entry)
+                    elif not entry.is_symlink():
+                        sub_dir_paths.append(entry.path)
+            except OSError:
+                continue
+            yield dir_path, file_entries
+            dir_paths.extend(reversed(sub_dir_paths))
+
+    @classmethod
+    def _walk_dir(cls, path):
+        # Yield (relative directory, file name, source) for every file in the
+        # tree along with the directory holding the chapter contents, which is
+        # the first directory found to contain files.  source is the file's
+        # os.DirEntry.
+        contents_path = None
+        for dir_path, file_entries in cls._scan_dir(path):
+            if not file_entries:
+                continue
+            if contents_path is None:
+                contents_path = dir_path
+            rel_path = os.path.relpath(dir_path, contents_path)
+            for entry in file_entries:
+                yield rel_path, entry.name, entry
+
+    @classmethod
+    def _walk_zip(cls, members):
+        # The zip equivalent of _walk_dir, built from the central directory
+        # alone, given (normalised name, zipfile.ZipInfo) tuples.  The
+        # contents directory is the shallowest directory that holds any
+        # files.
+        members = [(name, member) for name, member in members if not
+                   name.endswith("/")]
+        roots = set(posixpath.dirname(name) or "." for name, member in
+                    members)
+        if not roots:
+            return
+        contents_path = min(roots, key=lambda root: (root.count("/"), root))
+        if contents_path == ".":
+            contents_path = ""
+        for name, member in members:
+            root, file_name = posixpath.split(name)
+            rel_path = posixpath.relpath(root or ".", contents_path or ".")
+            yield rel_path.replace("/", os.sep), file_name, member
+
+    def _plan_chapter(self, original_path, chapter_num, is_zip, dst,
+                      lesson_pattern, avi_dst, pdf_dst, ignored_exts, stats):
+        chapter = self.chapters[chapter_num]
+        if is_zip:
+            # Zip chapters are never extracted to a temporary directory; each
+            # member is later decompressed straight into its destination.
+            with stats.time("zip open"):
+                zip_file = zipfile.ZipFile(original_path)
+                # Zips made on Windows may separate directories with
+                # backslashes, so every member name is normalised once and
+                # that name alone is checked and walked.
+                members = [(member.filename.replace("\\", "/"), member) for
+                           member in zip_file.infolist()]
+            unsafe_names = [name for name, member in members if
+                            _UNSAFE_MEMBER_PATTERN.search(name)]
+            if unsafe_names:
+                zip_file.close()
+                _logger.error("The zip file, %s, has a member, %s, whose "
+                              "path is absolute or leads outside the zip. "
+                              "This chapter will be skipped.", original_path,
+                              unsafe_names[0])
+                return _ChapterPlan(self.course_id, chapter_num,
+                                    original_path, is_zip,
+                                    reason="member path, %s, is unsafe" %
+                                    unsafe_names[0])
+            names = [posixpath.basename(name) for name, member in members]
+            with zip_file, stats.time("walk"):
+                entries = list(self._walk_zip(members))
+        else:
+            with stats.time("walk"):
+                entries = list(self._walk_dir(original_path))
+            names = [file_name for rel_path, file_name, source in entries]
+        # Validate against the file names alone so that a chapter which does
+        # not match the course data costs no bytes written.
+        with stats.time("validate"):
+            reason = self._preflight(chapter, names, lesson_pattern,
+                                     ignored_exts)
+            if reason is None:
+                files = self._plan_files(chapter, entries, is_zip, dst,
+                                         lesson_pattern, avi_dst, pdf_dst,
+                                         ignored_exts)
+                if files is None:
+                    reason = "a file would be written outside the chapter"
+        if reason is not None:
+            return _ChapterPlan(self.course_id, chapter_num, original_path,
+                                is_zip, reason=reason)
+        return _ChapterPlan(self.course_id, chapter_num, original_path, is_zip,
+                            files)
+
+    @classmethod
+    def _preflight(cls, chapter, file_names, lesson_pattern, ignored_exts):
+        # Return the reason the chapter must be skipped, or None if the file
+        # names match the course data.  lesson_pattern is compiled and
+        # ignored_exts is a set.
+        video_nums = set()
+        for file_name in file_names:
+            if not file_name:
+                continue
+            ext = os.path.splitext(file_name)[1][1:].lower()
+            if ext in ignored_exts or ext not in _LESSON_EXTS:
+                continue
+            lesson_match = lesson_pattern.match(file_name)
+            if lesson_match is None:
+                continue
+            num = int(lesson_match.group(1))
+            if num not in chapter.lessons:
+                _logger.error("Lesson number, %s, does not exist on "
                               "LearnItFirst.com. This chapter will be "
-                              "skipped." % chapter_num)
+                              "skipped; lessons cannot be renamed with "
+                              "confidence as a missing lesson file could "
+                              "point to a mix up in the other lesson names." %
+                              num)
+                return "lesson number, %s, does not exist" % num
+            if ext == "avi":
+                video_nums.add(num)
+        if set(chapter.lessons) != video_nums:
+            _logger.error("The video contents for chapter number, %s, are "
+                          "different to what is listed on LearnItFirst.com. "
+                          "This chapter will be skipped." % chapter.num)
+            return "video contents differ from LearnItFirst.com"
+
+    def _plan_files(self, chapter, entries, is_zip, dst, lesson_pattern,
+                    avi_dst, pdf_dst, ignored_exts):
+        # The chapter has already passed _preflight so every lesson number
+        # found here is known to exist.  Return None if any file would be
+        # written outside the chapter's directory in its destination.
+        files = []
+        _logger.debug("Searching for valid lesson files for chapter, %s.",
+                      chapter.num)
+        # Checked once rather than by a call per file.
+        debug = _logger.isEnabledFor(logging.DEBUG)
+        chapter_rel_path = os.path.join(self.title, chapter.name)
+        # Files arrive a directory at a time, so each directory's destination
+        # is only joined once.
+        dst_rel_paths = {os.curdir: chapter_rel_path}
+        # Maps each (destination, relative directory) pair that has been
+        # checked to resolve under the chapter's directory to its path.
+        dir_paths = {}
+        for rel_path, file_name, source in entries:
+            ext = os.path.splitext(file_name)[1][1:].lower()
+            if ext in ignored_exts:
                 continue
-            for _file in files:
-                _logger.info("Moving and renaming %s to %s" %
-                             (_file.file_path, _file.new_file_path))
-                # Use shutil in case the user is moving files to a new file
-                # system, i.e. an external HDD.
-                dir_path = os.path.dirname(_file.new_file_path)
-                if not os.path.isdir(dir_path):
-                    os.makedirs(dir_path)
-                shutil.move(_file.file_path, _file.new_file_path)
-            if completed_prefix is not None:
-                head, tail = os.path.split(original_path)
-                _logger.debug("Prepending \"DONE\" to chapter number, %s's "
-                              "old zip file / directory to stop it from being "
-                              "analysed if  organise() is re-called." %
-                              chapter_num)
-                os.rename(original_path, os.path.join(head, completed_prefix +
-                                                      tail))
-        if os.path.isdir(temp_dir_path):
-            _logger.info("Deleting the temporary directory tree at %s." %
-                         temp_dir_path)
-            shutil.rmtree(temp_dir_path, onerror=self._remove_readonly)
+            dst_rel_path = dst_rel_paths.get(rel_path)
+            if dst_rel_path is None:
+                dst_rel_path = dst_rel_paths[rel_path] = os.path.join(
+                    chapter_rel_path, rel_path)
+            lesson_match = lesson_pattern.match(file_name)
+            if lesson_match is not None:
+                if debug:
+                    _logger.debug("A valid lesson file that matches the file "
+                                  "name format has been found at %s.",
+                                  file_name)
+                num = int(lesson_match.group(1))
+                if ext in _LESSON_EXTS:
+                    name = chapter.lessons[num].name + os.path.extsep + ext
+                    if ext == "avi":
+                        destination = avi_dst
+                    elif ext == "pdf":
+                        destination = pdf_dst
+                else:
+                    description = lesson_match.group(2).strip()
+                    if not description:
+                        _logger.warning("file name, %s, contains no "
+                                        "description and so renamed file will "
+                                        "be non-descript", file_name)
+                    name = (self._transform_name(num, description,
+                                                 self.course_id,
+                                                 chapter.num) +
+                            os.path.extsep + ext)
+                    destination = dst
+            else:
+                if debug:
+                    _logger.debug("A file has been found that does not match "
+                                  "the lesson file name format. It will "
+                                  "still be moved but not renamed.")
+                num = None
+                name = file_name
+                destination = dst
+            dir_path = dir_paths.get((destination, dst_rel_path))
+            if dir_path is None:
+                dir_path = self._chapter_dir_path(destination,
+                                                  chapter_rel_path,
+                                                  dst_rel_path)
+                dir_paths[destination, dst_rel_path] = dir_path
+            if (not dir_path or name in (os.curdir, os.pardir) or os.sep in
+                    name or (os.altsep and os.altsep in name)):
+                _logger.error("The file, %s, would be written outside the "
+                              "directory of chapter, %s. This chapter will "
+                              "be skipped.", file_name, chapter.num)
+                return None
+            new_file_path = os.path.join(dir_path, name)
+            if is_zip:
+                files.append(_File(ext, num, source.filename, new_file_path,
+                                   destination, source.file_size, source))
+            else:
+                files.append(_File(ext, num, source.path, new_file_path,
+                                   destination, source.stat().st_size))
+        return files
+
+    @classmethod
+    def _chapter_dir_path(cls, destination, chapter_rel_path, dst_rel_path):
+        # Return the path to a directory in a chapter's destination, or None
+        # if it resolves, symbolic links included, outside the chapter's own
+        # directory.
+        dir_path = os.path.join(destination, dst_rel_path)
+        real_path = os.path.realpath(dir_path)
+        chapter_path = os.path.realpath(os.path.join(destination,
+                                                     chapter_rel_path))
+        if real_path != chapter_path and not real_path.startswith(
+                os.path.join(chapter_path, "")):
+            return None
+        return dir_path
 
 
 class _Chapter(object):
@@ -497,12 +1103,496 @@ class _Chapter(object):
         self.lessons = lessons
 
 
+class _ChapterPlan(object):
+    def __init__(self, course_id, num, path, is_zip, files=(), reason=None,
+                 journal_path=None, done=(), manifest_path=None,
+                 store_path=None):
+        self.course_id = course_id
+        self.num = num
+        self.path = path
+        self.is_zip = is_zip
+        self.files = list(files)
+        self.reason = reason
+        self.size = sum(_file.size for _file in self.files)
+        self.journal_path = journal_path
+        # The indexes of files already moved by an earlier, interrupted run.
+        self.done = set(done)
+        self.manifest_path = manifest_path
+        self.store_path = store_path
+
+    @classmethod
+    def from_journal(cls, journal_path, members=True):
+        # Rebuild the plan recorded by an interrupted run, or return None if
+        # the journal is unreadable.
+        header, done = _Journal(journal_path).read()
+        if header is None:
+            return None
+        files = [_File(*fields) for fields in header["files"]]
+        if header["is_zip"] and members:
+            try:
+                with zipfile.ZipFile(header["path"]) as zip_file:
+                    for _file in files:
+                        _file.member = zip_file.getinfo(_file.file_path)
+            except (OSError, KeyError, zipfile.BadZipFile):
+                return None
+        return cls(header["course_id"], header["num"], header["path"],
+                   header["is_zip"], files, journal_path=journal_path,
+                   done=done)
+
+    def execute(self, completed_prefix=None, journal=True, on_file=None,
+                verify=False, dedup=False, extract_workers=1,
+                device_queues=None, progress=None):
+        # Everything the chapter needs is held by the plan so that this method
+        # can be submitted to either a thread or a process pool.
+        start_time = time.time()
+        if journal and self.journal_path is not None:
+            journal = _Journal(self.journal_path)
+            if self.done:
+                _logger.info("Resuming chapter number, %s, from its journal; "
+                             "%s of %s files were already moved." %
+                             (self.num, len(self.done), len(self.files)))
+            else:
+                journal.start(self)
+        else:
+            journal = None
+        if self.is_zip:
+            _logger.info("Chapter number, %s, was found to be a zipfile and "
+                         "is being decompressed into place. This may take a "
+                         "while..." % self.num)
+        content_store = None
+        store_path = dedup if isinstance(dedup, str) else self.store_path
+        if dedup and store_path is not None:
+            content_store = store.ContentStore(store_path)
+        pending = []
+        for file_index, _file in enumerate(self.files):
+            if file_index not in self.done:
+                pending.append(file_index)
+            elif on_file is not None:
+                on_file(_file)
+        # Zip members are compressed independently, so a large chapter zip is
+        # inflated by several threads at once.  zlib releases the GIL whilst
+        # inflating, so threads are enough even within a worker process.
+        if (not self.is_zip or self.size < _PARALLEL_EXTRACT_MIN_SIZE or
+                len(pending) < 2):
+            extract_workers = 1
+        # With device queues, the pending files are split by the device they
+        # are written to and each device's files are transferred by its own
+        # threads, so that a slow device does not hold up a fast one.
+        queues = {None: pending}
+        concurrencies = {None: extract_workers}
+        limiters = {}
+        if device_queues:
+            queues = {}
+            devices = {}
+            for file_index in pending:
+                destination = self.files[file_index].destination
+                device = devices.get(destination)
+                if device is None:
+                    device = devices[destination] = os.stat(
+                        destination).st_dev
+                queues.setdefault(device, []).append(file_index)
+            for device in queues:
+                device_queue = device_queues.get(device)
+                if device_queue is None:
+                    concurrencies[device] = extract_workers
+                    continue
+                concurrencies[device] = (device_queue.concurrency or
+                                         extract_workers)
+                if device_queue.limiter is not None:
+                    limiters[device] = device_queue.limiter
+        threads = sum(concurrencies[device] for device in queues)
+        buffer_size = None
+        if threads > 1:
+            buffer_size = max(1024 * 1024, _PARALLEL_EXTRACT_BUFFER_SIZE //
+                              threads)
+        chapter_workers = []
+        local = threading.local()
+        lock = threading.Lock()
+
+        def transfer_file(file_index, device=None):
+            chapter_worker = getattr(local, "chapter_worker", None)
+            if chapter_worker is None:
+                chapter_worker = local.chapter_worker = _ChapterWorker(
+                    self, verify, content_store, buffer_size, limiters,
+                    progress)
+                with lock:
+                    chapter_workers.append(chapter_worker)
+            _file = self.files[file_index]
+            device_queue = None
+            if device_queues:
+                device_queue = device_queues.get(device)
+            if device_queue is None:
+                chapter_worker.transfer(_file)
+            else:
+                with device_queue:
+                    chapter_worker.transfer(_file)
+            if journal is not None:
+                with lock:
+                    journal.mark_done(file_index)
+            # on_file may block, e.g. while the encoder's queue is full, so
+            # it is called without the lock held.
+            if on_file is not None:
+                on_file(_file)
+
+        executors = []
+        try:
+            if threads > 1:
+                _logger.info("Transferring chapter number, %s, using %s "
+                             "threads across %s devices." %
+                             (self.num, threads, len(queues)))
+                transfers = []
+                for device, indexes in queues.items():
+                    concurrency = concurrencies[device]
+                    if concurrency > 1:
+                        # Starting the largest members first stops a single
+                        # large member from being left to inflate on its own
+                        # at the end.
+                        indexes.sort(key=lambda file_index:
+                                     self.files[file_index].size,
+                                     reverse=True)
+                    executor = futures.ThreadPoolExecutor(concurrency)
+                    executors.append(executor)
+                    transfers.extend(executor.submit(transfer_file,
+                                                     file_index, device) for
+                                     file_index in indexes)
+                try:
+                    for future in futures.as_completed(transfers):
+                        future.result()
+                except BaseException:
+                    # Stop at the first failure, as a single thread would,
+                    # rather than transferring the rest of the chapter first.
+                    for future in transfers:
+                        future.cancel()
+                    raise
+            else:
+                for device, indexes in queues.items():
+                    for file_index in indexes:
+                        transfer_file(file_index, device)
+        finally:
+            for executor in executors:
+                executor.shutdown()
+            for chapter_worker in chapter_workers:
+                chapter_worker.close()
+            if journal is not None:
+                journal.close()
+        # Stage timings are gathered locally and returned on the summary
+        # because a process worker cannot update the caller's RunStats.
+        stages = {}
+        transfers = {}
+        checksums = []
+        deduplicated = [0, 0]
+        for chapter_worker in chapter_workers:
+            for stage, (count, seconds) in chapter_worker.stages.items():
+                totals = stages.setdefault(stage, [0, 0.0])
+                totals[0] += count
+                totals[1] += seconds
+            for destination, transfer_stats in (
+                    chapter_worker.transferer.stats.items()):
+                transfer.merge_stats(transfers.setdefault(
+                    destination, [0, 0, None, None]), transfer_stats)
+            checksums.extend((path, size, crc32) for path, (size, crc32) in
+                             chapter_worker.transferer.checksums.items())
+            deduplicated[0] += chapter_worker.deduplicated[0]
+            deduplicated[1] += chapter_worker.deduplicated[1]
+        stage_start_time = time.perf_counter()
+        if completed_prefix is not None:
+            head, tail = os.path.split(self.path)
+            _logger.debug("Prepending \"DONE\" to chapter number, %s's old "
+                          "zip file / directory to stop it from being "
+                          "analysed if  organise() is re-called." % self.num)
+            os.rename(self.path, os.path.join(head, completed_prefix + tail))
+        if journal is not None:
+            journal.remove()
+        elif self.journal_path is not None:
+            # A journal left by an interrupted, journaled run no longer
+            # describes the chapter now that it is complete.
+            _Journal(self.journal_path).remove()
+        stages["cleanup"] = [1, time.perf_counter() - stage_start_time]
+        if deduplicated[0]:
+            _logger.info("Chapter number, %s, linked %s files (%s bytes) to "
+                         "identical stored copies rather than transferring "
+                         "them." % (self.num, deduplicated[0],
+                                    deduplicated[1]))
+        return _ChapterSummary(self.num, self.path, "organised",
+                               files=len(self.files), size=self.size,
+                               seconds=time.time() - start_time,
+                               transfers=transfers, stages=stages,
+                               checksums=checksums)
+
+    def rollback(self):
+        # Undo the moves of an interrupted chapter, newest first, so that the
+        # chapter can be organised from scratch.
+        transferer = transfer.Transferer()
+        for file_index in range(len(self.files) - 1, -1, -1):
+            _file = self.files[file_index]
+            if not os.path.exists(_file.new_file_path):
+                continue
+            if self.is_zip or (file_index not in self.done and
+                               os.path.exists(_file.file_path)):
+                # Decompressed members and partial copies are simply removed.
+                os.remove(_file.new_file_path)
+            else:
+                transferer.move(_file.new_file_path, _file.file_path)
+        _Journal(self.journal_path).remove()
+
+
+class _ChapterWorker(object):
+    # The zip file handle, transferer and tallies used by one thread whilst
+    # transferring a chapter's files, so that the threads sharing a chapter
+    # share nothing but its journal.
+    def __init__(self, chapter_plan, verify=False, content_store=None,
+                 buffer_size=None, limiters=None, progress=None):
+        self.chapter_plan = chapter_plan
+        self.content_store = content_store
+        self.progress = progress
+        self.stages = {}
+        # The number and bytes of files linked rather than transferred.
+        self.deduplicated = [0, 0]
+        self._chapter = (chapter_plan.course_id, chapter_plan.num)
+        self._stage = "extract" if chapter_plan.is_zip else "move"
+        # The log file keeps a record of every move at INFO, so this is only
+        # false if logging has been disabled; checked once per chapter rather
+        # than by a call per file.
+        self._log_moves = _logger.isEnabledFor(logging.INFO)
+        on_bytes = None
+        if progress is not None:
+            on_bytes = functools.partial(progress.add, self._chapter,
+                                         self._stage)
+        # A transferer per thread keeps its directory and device caches free
+        # of locks whether chapters run on threads or processes.
+        if buffer_size is None:
+            self.transferer = transfer.Transferer(verify=verify,
+                                                  limiters=limiters,
+                                                  on_bytes=on_bytes)
+        else:
+            self.transferer = transfer.Transferer(buffer_size, verify,
+                                                  limiters, on_bytes)
+        self.zip_file = None
+        if chapter_plan.is_zip:
+            stage_start_time = time.perf_counter()
+            self.zip_file = zipfile.ZipFile(chapter_plan.path)
+            self._add_stage("zip open", stage_start_time)
+
+    def _add_stage(self, stage, stage_start_time, count=1):
+        stage_times = self.stages.setdefault(stage, [0, 0.0])
+        stage_times[0] += count
+        stage_times[1] += time.perf_counter() - stage_start_time
+
+    def _find_duplicate(self, _file):
+        # Return the stored copy identical to a file, or None, and the file's
+        # digest.  The file is only hashed if a stored file has its size.
+        if not self.content_store.has_size(_file.size):
+            return None, None
+        if self.chapter_plan.is_zip:
+            fp = self.zip_file.open(_file.member)
+        else:
+            fp = open(_file.file_path, "rb")
+        with fp:
+            digest = self.content_store.digest(fp)
+        return self.content_store.lookup(_file.size, digest), digest
+
+    def transfer(self, _file):
+        is_zip = self.chapter_plan.is_zip
+        if self._log_moves:
+            _logger.info("Moving and renaming %s to %s", _file.file_path,
+                         _file.new_file_path)
+        crc32 = _file.member.CRC if is_zip else None
+        # Only files that kept their original name, such as exercise
+        # databases and sample scripts, are deduplicated; lessons are unique
+        # to their chapter.
+        deduplicate = self.content_store is not None and (
+            _file.num is None) and (is_zip or os.path.exists(_file.file_path))
+        object_path = digest = None
+        # The bytes of the file that its transfer did not report as written.
+        unreported = 0
+        if deduplicate:
+            stage_start_time = time.perf_counter()
+            object_path, digest = self._find_duplicate(_file)
+            if object_path is not None:
+                self.transferer.link(object_path, _file.new_file_path, crc32)
+                if not is_zip:
+                    os.remove(_file.file_path)
+                self.deduplicated[0] += 1
+                self.deduplicated[1] += _file.size
+                unreported = _file.size
+            self._add_stage("dedup", stage_start_time)
+        if object_path is None:
+            stage_start_time = time.perf_counter()
+            if is_zip:
+                with self.zip_file.open(_file.member) as fsrc:
+                    self.transferer.write(fsrc, _file.new_file_path,
+                                          _file.destination, crc32)
+            elif (os.path.exists(_file.file_path) or not
+                  os.path.exists(_file.new_file_path)):
+                self.transferer.move(_file.file_path, _file.new_file_path,
+                                     _file.destination)
+            else:
+                # The move completed before an interruption stopped it from
+                # being journaled.
+                unreported = _file.size
+            self._add_stage(self._stage, stage_start_time)
+        if deduplicate and object_path is None:
+            # The first copy of a file is stored once it is in place so that
+            # later copies can be linked to it.
+            stage_start_time = time.perf_counter()
+            if digest is None:
+                with open(_file.new_file_path, "rb") as fp:
+                    digest = self.content_store.digest(fp)
+            self.content_store.add(_file.new_file_path, _file.size, digest)
+            self._add_stage("dedup", stage_start_time, 0)
+        if self.progress is not None:
+            self.progress.add(self._chapter, self._stage if object_path is
+                              None else "dedup", unreported, 1)
+
+    def close(self):
+        if self.zip_file is not None:
+            self.zip_file.close()
+
+
+class _DeviceQueue(object):
+    # The concurrency and bandwidth caps on one destination device, shared by
+    # every chapter transferring to it.  Entering the queue waits for one of
+    # its concurrency slots.
+    def __init__(self, concurrency=None, limiter=None):
+        self.concurrency = concurrency
+        self.limiter = limiter
+        self._semaphore = None
+        if concurrency:
+            self._semaphore = threading.BoundedSemaphore(concurrency)
+
+    def __getstate__(self):
+        return {"concurrency": self.concurrency, "limiter": self.limiter}
+
+    def __setstate__(self, state):
+        self.__init__(state["concurrency"], state["limiter"])
+
+    def __enter__(self):
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+
+class _Journal(object):
+    # An append-only record of a chapter's planned moves followed by the index
+    # of each move as it completes, one JSON document per line.
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def _append(self, record):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND |
+                               os.O_CREAT)
+        # A single unbuffered write per record means an interruption can lose
+        # at most the record being written, never corrupt an earlier one.
+        os.write(self._fd, (json.dumps(record) + "\n").encode("utf-8"))
+
+    def start(self, chapter_plan):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self._append({
+            "course_id": chapter_plan.course_id,
+            "num": chapter_plan.num,
+            "path": chapter_plan.path,
+            "is_zip": chapter_plan.is_zip,
+            "files": [[_file.ext, _file.num, _file.file_path,
+                       _file.new_file_path, _file.destination, _file.size]
+                      for _file in chapter_plan.files]
+        })
+
+    def mark_done(self, index):
+        self._append({"done": index})
+
+    def read(self):
+        header = None
+        done = set()
+        try:
+            with open(self.path) as fp:
+                for line in fp:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # A torn final line.
+                    if header is None:
+                        header = record
+                    else:
+                        done.add(record["done"])
+        except OSError:
+            return None, done
+        return header, done
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _ChapterSummary(object):
+    def __init__(self, num, path, status, reason=None, files=0, size=0,
+                 seconds=0.0, transfers=None, stages=None, checksums=None):
+        self.num = num
+        self.path = path
+        self.status = status
+        self.reason = reason
+        self.files = files
+        self.size = size
+        self.seconds = seconds
+        self.transfers = transfers or {}
+        self.stages = stages or {}
+        self.checksums = checksums or []
+
+    def __str__(self):
+        if self.reason is not None:
+            return "Chapter %s (%s): %s; %s." % (self.num, self.path,
+                                                 self.status, self.reason)
+        return ("Chapter %s (%s): %s; %s files, %s bytes in %.1f seconds." %
+                (self.num, self.path, self.status, self.files, self.size,
+                 self.seconds))
+
+
+class _LazyChapters(collections.abc.Mapping):
+    # A read-only dict of _Chapter objects whose lessons are loaded from the
+    # catalogue only when the chapter is accessed.
+    def __init__(self, catalogue_path, course_id, names):
+        self.catalogue_path = catalogue_path
+        self.course_id = course_id
+        self.names = names
+
+    def __getitem__(self, chapter_num):
+        name = self.names[chapter_num]
+        lessons = catalogue.open_catalogue(self.catalogue_path).lessons(
+            self.course_id, chapter_num)
+        return _Chapter(chapter_num, name, {
+            lesson_num: _Lesson(lesson_num, lesson_name) for lesson_num,
+            lesson_name in lessons.items()})
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
 class _File(object):
-    def __init__(self, ext, num, file_path, new_file_path):
+    def __init__(self, ext, num, file_path, new_file_path, destination, size,
+                 member=None):
         self.ext = ext
         self.num = num
         self.file_path = file_path
         self.new_file_path = new_file_path
+        self.destination = destination
+        self.size = size
+        self.member = member
 
 
 class _Lesson(object):
@@ -511,12 +1601,466 @@ class _Lesson(object):
         self.name = name
 
 
-def _main():
-    parser = argparse.ArgumentParser(description="Scrape the course, chapter "
-                                     "and lesson data from LearnItFirst.com "
-                                     "and then organise, move and rename "
-                                     "pre-downloaded course chapters "
-                                     "accordingly.")
+class _Plan(object):
+    def __init__(self, course_ids, chapters, index=None):
+        self.course_ids = course_ids
+        self.chapters = chapters
+        self.index = index
+        self.bytes_per_device = {}
+        self.bytes_renamed_per_device = {}
+        devices = {}
+        for chapter_plan in chapters:
+            if not chapter_plan.files:
+                continue
+            src_device = None
+            if not chapter_plan.is_zip:
+                src_device = os.stat(chapter_plan.path).st_dev
+            for _file in chapter_plan.files:
+                device = devices.get(_file.destination)
+                if device is None:
+                    device = devices[_file.destination] = os.stat(
+                        _file.destination).st_dev
+                if device == src_device:
+                    totals = self.bytes_renamed_per_device
+                else:
+                    totals = self.bytes_per_device
+                totals[device] = totals.get(device, 0) + _file.size
+
+    def __str__(self):
+        lines = []
+        for chapter_plan in self.chapters:
+            if chapter_plan.reason is not None:
+                lines.append("Skip chapter %s of course ID, %s, at %s; %s." %
+                             (chapter_plan.num, chapter_plan.course_id,
+                              chapter_plan.path, chapter_plan.reason))
+                continue
+            lines.append("Organise chapter %s of course ID, %s, at %s; %s "
+                         "files, %s bytes." %
+                         (chapter_plan.num, chapter_plan.course_id,
+                          chapter_plan.path, len(chapter_plan.files),
+                          chapter_plan.size))
+            for _file in chapter_plan.files:
+                lines.append("    %s -> %s (%s bytes)" %
+                             (_file.file_path, _file.new_file_path,
+                              _file.size))
+        for device, size in sorted(self.bytes_per_device.items()):
+            lines.append("%s bytes to be written to device %s." % (size,
+                                                                   device))
+        for device, size in sorted(self.bytes_renamed_per_device.items()):
+            lines.append("%s bytes to be renamed on device %s." % (size,
+                                                                   device))
+        return "\n".join(lines)
+
+
+def organise_many(courses_with_patterns, src, dst, avi_dst=None, pdf_dst=None,
+                  completed_prefix=None, ignored_exts=("html",), workers=1,
+                  use_processes=False, journal=True, rescan=False,
+                  encoder=None, stats=None, verify=False, dedup=False,
+                  extract_workers=1, device_limits=None, progress=None):
+    """Organise, move and rename the chapters of several courses from within a
+    single scan of a source directory and return a dict mapping each course
+    ID to a list of per-chapter summaries, ordered by chapter number.
+
+    Keyword arguments:
+    courses_with_patterns -- an iterable of (course, chapter_pattern,
+        lesson_pattern) tuples where course is a Course object and the
+        patterns are as described for Course.organise.  Each entry in src is
+        sent to the first course whose chapter_pattern it matches
+    src, dst, avi_dst, pdf_dst, completed_prefix, ignored_exts, workers,
+        use_processes, journal, rescan, encoder, stats, verify, dedup,
+        extract_workers, device_limits, progress -- as described for
+        Course.organise
+    """
+    courses_with_patterns = list(courses_with_patterns)
+    plan = _plan_many(courses_with_patterns, src, dst, avi_dst, pdf_dst,
+                      ignored_exts, rescan, stats=stats)
+    return Course.execute(plan, completed_prefix, workers, use_processes,
+                          journal, encoder, stats, verify, dedup,
+                          extract_workers, device_limits, progress)
+
+
+def watch_many(courses_with_patterns, src, dst, avi_dst=None, pdf_dst=None,
+               completed_prefix=None, ignored_exts=("html",), workers=1,
+               use_processes=False, journal=True, rescan=False, encoder=None,
+               settle_time=10.0, poll_interval=5.0, stop_event=None,
+               stats=None, verify=False, dedup=False, extract_workers=1,
+               device_limits=None, progress=None):
+    """Organise, move and rename the chapters of several courses as they
+    finish arriving in a source directory, until stop_event is set, and
+    return a dict mapping each course ID to a list of per-chapter summaries,
+    ordered by chapter number.  Chapters already in src are organised first.
+
+    Keyword arguments:
+    courses_with_patterns -- as described for organise_many
+    src, dst, avi_dst, pdf_dst, completed_prefix, ignored_exts, workers,
+        use_processes, journal, rescan, encoder, settle_time, poll_interval,
+        stop_event, stats, verify, dedup, extract_workers, device_limits,
+        progress -- as described for Course.watch
+    """
+    # The courses are read here and again by every scan, so a generator
+    # passed in must only be consumed once.
+    courses_with_patterns = list(courses_with_patterns)
+    chapter_patterns = [re.compile(chapter_pattern) for course,
+                        chapter_pattern, lesson_pattern in
+                        courses_with_patterns]
+    results = {course.course_id: [] for course, chapter_pattern,
+               lesson_pattern in courses_with_patterns}
+    # Map the name of each chapter yet to be organised to its last signature
+    # and the time at which that signature was first seen.
+    pending = {}
+    _logger.info("Watching %s for course chapters." % src)
+    with watch.new_watcher(src) as watcher:
+        names = set(os.listdir(src))
+        while stop_event is None or not stop_event.is_set():
+            now = time.time()
+            for name in names:
+                if any(chapter_pattern.match(name) for chapter_pattern in
+                       chapter_patterns):
+                    pending.setdefault(name, (None, None))
+            ready = set()
+            for name, (last_signature, since) in list(pending.items()):
+                path = os.path.join(src, name)
+                signature = watch.signature(path)
+                if signature is None:
+                    del pending[name]
+                    continue
+                if signature != last_signature:
+                    if last_signature is None:
+                        # An entry seen for the first time has been unchanged
+                        # since it was last modified.
+                        since = min(now, signature[2])
+                    else:
+                        since = now
+                    pending[name] = (signature, since)
+                if now - since < settle_time:
+                    continue
+                del pending[name]
+                if os.path.isfile(path) and not zipfile.is_zipfile(path):
+                    # The download has stalled rather than finished; a later
+                    # write brings the entry back.
+                    _logger.debug("%s has settled but is not a valid zip "
+                                  "file.", path)
+                    continue
+                ready.add(name)
+            if ready:
+                _logger.info("Organising %s now that %s complete." %
+                             (", ".join(sorted(ready)), "it is" if
+                              len(ready) == 1 else "they are"))
+                plan = _plan_many(courses_with_patterns, src, dst, avi_dst,
+                                  pdf_dst, ignored_exts, rescan, ready,
+                                  stats)
+                for course_id, summaries in Course.execute(
+                        plan, completed_prefix, workers, use_processes,
+                        journal, encoder, stats, verify, dedup,
+                        extract_workers, device_limits, progress).items():
+                    results[course_id].extend(summaries)
+            names = watcher.wait(min(poll_interval, settle_time) if pending
+                                 else poll_interval)
+    _logger.info("Stopped watching %s." % src)
+    for summaries in results.values():
+        summaries.sort(key=lambda summary: summary.num)
+    return results
+
+
+def enqueue_many(queue_path, course_ids_with_patterns, src, dst, avi_dst=None,
+                 pdf_dst=None, completed_prefix=None, ignored_exts=("html",),
+                 journal=True, rescan=False, verify=False, dedup=False):
+    """Add each chapter of several courses found in a source directory to a
+    job queue, from which any number of workers calling work() on any number
+    of hosts claim and organise them, and return the number of jobs added.
+    A chapter that already has a job which has not failed is only added again
+    once it has changed.
+
+    Keyword arguments:
+    queue_path -- the full path to the queue's SQLite database, which should
+        be on storage shared by every worker and is created if necessary
+    course_ids_with_patterns -- an iterable of (course_id, chapter_pattern,
+        lesson_pattern) tuples as described for organise_many, but with the
+        course ID in place of the course since only the workers need its data
+    src, dst, avi_dst, pdf_dst, completed_prefix, ignored_exts, journal,
+        rescan, verify, dedup -- as described for Course.organise.  The
+        paths must be valid on every worker's host
+    """
+    if not os.path.isdir(src):
+        _logger.critical("Invalid or non-existent source directory, %s." %
+                         src)
+        raise OSError("invalid / non-existent source directory, %s" % src)
+    # The workers compile the patterns again, so the routes carry their
+    # source text.
+    routes = [(re.compile(chapter_pattern), (course_id, chapter_pattern),
+               lesson_pattern) for course_id, chapter_pattern, lesson_pattern
+              in course_ids_with_patterns]
+    job_queue = jobs.JobQueue(queue_path)
+    options = {
+        "src": os.path.abspath(src),
+        "dst": os.path.abspath(dst),
+        "avi_dst": avi_dst and os.path.abspath(avi_dst),
+        "pdf_dst": pdf_dst and os.path.abspath(pdf_dst),
+        "completed_prefix": completed_prefix,
+        "ignored_exts": list(ignored_exts),
+        "journal": journal,
+        "rescan": rescan,
+        "verify": verify,
+        "dedup": os.path.abspath(dedup) if isinstance(dedup, str) else dedup
+    }
+    added = 0
+    for entry, chapter_match, route, lesson_pattern in _discover(src, routes):
+        course_id, chapter_pattern = route
+        options.update(chapter_pattern=chapter_pattern,
+                       lesson_pattern=lesson_pattern)
+        if job_queue.enqueue(course_id, os.path.abspath(entry.path),
+                             entry.stat(), options):
+            _logger.debug("Chapter number, %s, at %s has been queued.",
+                          int(chapter_match.group(1)), entry.path)
+            added += 1
+    _logger.info("Added %s jobs to the queue at %s." % (added, queue_path))
+    return added
+
+
+def work(queue_path, stop_event=None, drain=False, lease_seconds=300.0,
+         poll_interval=5.0, encoder=None, stats=None, extract_workers=1,
+         device_limits=None, progress=None, stderr_level_override=None):
+    """Claim chapters from a job queue filled by enqueue_many(), organise
+    each and acknowledge it, until stop_event is set, and return a dict
+    mapping each course ID to a list of per-chapter summaries, ordered by
+    chapter number.  The lease on a chapter is renewed while it is
+    organised, so a chapter is only claimed by another worker if this one
+    crashes or hangs, in which case the chapter is resumed from its journal.
+    A chapter that fails is returned to the queue to be retried, up to the
+    queue's maximum number of attempts.
+
+    Keyword arguments:
+    queue_path -- as described for enqueue_many
+    stop_event -- a threading.Event which stops the worker, once the chapter
+        in hand is organised, when set.  If no value is passed, the worker
+        only stops when interrupted or drained (default None)
+    drain -- whether to stop once no chapter is pending or leased.  A
+        worker draining the queue waits for leased chapters, so that it can
+        retry those of a crashed worker (default False)
+    lease_seconds -- the number of seconds for which a chapter is leased,
+        renewed every third of that whilst it is organised (default 300.0)
+    poll_interval -- the number of seconds between checks of an empty queue
+        (default 5.0)
+    encoder, stats, extract_workers, device_limits, progress -- as described
+        for Course.organise
+    stderr_level_override -- as described for Course.get, used when each
+        course's data is loaded, once per course per call (default None)
+    """
+    job_queue = jobs.JobQueue(queue_path)
+    owner = "%s:%s:%s" % (socket.gethostname(), os.getpid(),
+                          threading.get_ident())
+    courses = {}
+    results = {}
+    _logger.info("Working on the queue at %s as %s." % (queue_path, owner))
+    while stop_event is None or not stop_event.is_set():
+        job = job_queue.claim(owner, lease_seconds)
+        if job is None:
+            if drain and not job_queue.counts()["leased"]:
+                break
+            if stop_event is None:
+                time.sleep(poll_interval)
+            else:
+                stop_event.wait(poll_interval)
+            continue
+        _logger.info("Claimed %s." % job)
+        done = threading.Event()
+
+        def renew(job=job, done=done):
+            while not done.wait(lease_seconds / 3):
+                if not job_queue.renew(job, lease_seconds):
+                    _logger.error("The lease on %s has been lost." % job)
+                    return
+
+        heartbeat = threading.Thread(target=renew, daemon=True)
+        heartbeat.start()
+        options = job.options
+        try:
+            course = courses.get(job.course_id)
+            if course is None:
+                course = courses[job.course_id] = Course.get(
+                    job.course_id, stderr_level_override)
+            plan = _plan_many([(course, options["chapter_pattern"],
+                                options["lesson_pattern"])], options["src"],
+                              options["dst"], options["avi_dst"],
+                              options["pdf_dst"], options["ignored_exts"],
+                              options["rescan"],
+                              {os.path.basename(job.path)}, stats)
+            summaries = Course.execute(plan, options["completed_prefix"],
+                                       journal=options["journal"],
+                                       encoder=encoder, stats=stats,
+                                       verify=options["verify"],
+                                       dedup=options["dedup"],
+                                       extract_workers=extract_workers,
+                                       device_limits=device_limits,
+                                       progress=progress)[job.course_id]
+        except Exception as error:
+            done.set()
+            heartbeat.join()
+            _logger.error("%s failed and will be retried unless it has been "
+                          "attempted %s times: %s" %
+                          (job, job_queue.max_attempts, error))
+            job_queue.fail(job, "%s: %s" % (type(error).__name__, error))
+            continue
+        except BaseException:
+            # The chapter is left journaled for whichever worker claims it
+            # next.
+            done.set()
+            heartbeat.join()
+            job_queue.release(job)
+            raise
+        done.set()
+        heartbeat.join()
+        # A chapter that has gone from src, e.g. because a crashed worker
+        # renamed it with completed_prefix before acknowledging it, has no
+        # summary.  One still there is acknowledged as it now is, since
+        # organising a directory chapter changes its tree.
+        try:
+            stat = os.stat(job.path)
+        except FileNotFoundError:
+            stat = None
+        job_queue.ack(job, "\n".join(str(summary) for summary in summaries)
+                      or "no longer in src", stat)
+        results.setdefault(job.course_id, []).extend(summaries)
+    _logger.info("Stopped working on the queue at %s." % queue_path)
+    for summaries in results.values():
+        summaries.sort(key=lambda summary: summary.num)
+    return results
+
+
+def _plan_many(courses_with_patterns, src, dst, avi_dst=None, pdf_dst=None,
+               ignored_exts=("html",), rescan=False, names=None, stats=None):
+    courses_with_patterns = list(courses_with_patterns)
+    if not os.path.isdir(src):
+        _logger.critical("Invalid or non-existent source directory, %s." %
+                         src)
+        raise OSError("invalid / non-existent source directory, %s" % src)
+    if not os.path.isdir(dst):
+        _logger.critical("Invalid or non-existent destination directory, "
+                         "%s." % dst)
+        raise OSError("invalid / non-existent destination directory, %s" %
+                      dst)
+    if avi_dst is None:
+        avi_dst = dst
+    elif not os.path.isdir(avi_dst):
+        _logger.critical("Invalid or non-existent AVI destination "
+                         "directory, %s." % avi_dst)
+        raise OSError("invalid / non-existent AVI destination directory, "
+                      "%s" % avi_dst)
+    if pdf_dst is None:
+        pdf_dst = dst
+    elif not os.path.isdir(pdf_dst):
+        _logger.critical("Invalid or non-existent PDF destination "
+                         "directory, %s." % pdf_dst)
+        raise OSError("invalid / non-existent PDF destination directory, "
+                      "%s" % pdf_dst)
+    # Patterns are compiled and extensions put in a set once per scan rather
+    # than looked up once per file.
+    routes = [(re.compile(chapter_pattern), course,
+               re.compile(lesson_pattern)) for course, chapter_pattern,
+              lesson_pattern in courses_with_patterns]
+    ignored_exts = frozenset(ignored_exts)
+    _logger.debug("Searching for valid chapter directories for course IDs, "
+                  "%s." % ", ".join(str(course.course_id) for pattern, course,
+                                    lesson_pattern in routes))
+    if stats is None:
+        stats = report.RunStats()
+    journal_dir_path = os.path.join(dst, _STATE_DIR_NAME, "journal")
+    manifest_dir_path = os.path.join(dst, _STATE_DIR_NAME, "manifest")
+    # Every course organised into dst shares one store, so that files
+    # repeated across courses are stored once.
+    store_path = os.path.join(dst, _STATE_DIR_NAME, "store")
+    source_index = index.SourceIndex(os.path.join(dst, _STATE_DIR_NAME,
+                                                  "index" + os.extsep +
+                                                  "json"))
+    chapter_plans = []
+    for entry, chapter_match, course, lesson_pattern in _discover(src, routes,
+                                                                  names):
+        original_path = entry.path
+        _logger.debug("A valid chapter directory for course ID, %s, has been "
+                      "found at %s.", course.course_id, original_path)
+        chapter_num = int(chapter_match.group(1))
+        index_path = os.path.abspath(original_path)
+        stat = entry.stat()
+        outcome = source_index.lookup(index_path, stat)
+        if outcome is not None and not rescan:
+            _logger.debug("Chapter number, %s, at %s is unchanged since it "
+                          "was %s and will be skipped.", chapter_num,
+                          original_path, outcome)
+            if outcome != "skipped":
+                chapter_plans.append(_ChapterPlan(
+                    course.course_id, chapter_num, original_path,
+                    entry.is_file(), reason="unchanged since it was %s" %
+                    outcome))
+            continue
+        is_zip = entry.is_file() and zipfile.is_zipfile(original_path)
+        if not is_zip and entry.is_file():
+            source_index.record(index_path, stat, "skipped")
+            continue
+        journal_path = os.path.join(journal_dir_path, "c%03dch%02d%sjournal" %
+                                    (course.course_id, chapter_num,
+                                     os.extsep))
+        chapter_plan = None
+        if os.path.isfile(journal_path):
+            # An earlier run was interrupted part way through this chapter;
+            # its source may already be partly moved, so the journaled plan
+            # is resumed rather than the chapter walked and validated again.
+            chapter_plan = _ChapterPlan.from_journal(journal_path)
+            if chapter_plan is not None and chapter_plan.path != original_path:
+                chapter_plan = None
+        if chapter_plan is None:
+            chapter_plan = course._plan_chapter(original_path, chapter_num,
+                                                is_zip, dst, lesson_pattern,
+                                                avi_dst, pdf_dst,
+                                                ignored_exts, stats)
+            chapter_plan.journal_path = journal_path
+            if chapter_plan.reason is not None:
+                source_index.record(index_path, stat, "mismatched")
+        chapter_plan.manifest_path = os.path.join(
+            manifest_dir_path, "c%03d%smanifest" % (course.course_id,
+                                                    os.extsep))
+        chapter_plan.store_path = store_path
+        chapter_plans.append(chapter_plan)
+    return _Plan([course.course_id for chapter_pattern, course,
+                  lesson_pattern in routes], chapter_plans, source_index)
+
+
+def _pending_totals(chapter_plan):
+    # Return the number and bytes of a chapter's files not yet transferred.
+    files = size = 0
+    for file_index, _file in enumerate(chapter_plan.files):
+        if file_index not in chapter_plan.done:
+            files += 1
+            size += _file.size
+    return files, size
+
+
+def _discover(src, routes, names=None):
+    # Yield (entry, chapter match, course, lesson pattern) for each entry in
+    # src that matches a route's chapter pattern, as src is read, so that
+    # entries which match no route are never held.  The os.DirEntry carries
+    # the entry's type and stat, so nothing else in src is looked at.  Only
+    # the scan is incremental: _plan_many still collects every chapter's
+    # plan before Course.execute starts, since execute shares out device
+    # concurrency and reports progress from the totals of the whole plan.
+    for entry in os.scandir(src):
+        if names is not None and entry.name not in names:
+            continue
+        for chapter_pattern, course, lesson_pattern in routes:
+            chapter_match = chapter_pattern.match(entry.name)
+            if chapter_match:
+                yield entry, chapter_match, course, lesson_pattern
+                break
+
+
+def _add_output_arguments(parser):
+    _output_group = parser.add_mutually_exclusive_group()
+    _output_group.add_argument("-v", "--verbosity", action="count", default=0,
+                               help="increase output verbosity")
+    _output_group.add_argument("-q", "--quiet", action="count", default=0,
+                               help="decrease output verbosity")
+
+
+def _add_organise_arguments(parser, execute=True):
     parser.add_argument("course_id", help="the unique ID integer (between 100 "
                         "and 999) of the course", type=int)
     parser.add_argument("src", help="the full path to the source directory "
@@ -531,11 +2075,7 @@ def _main():
     parser.add_argument("lesson_pattern", help="a regex pattern representing "
                         "a valid lesson file that should be matched to "
                         "scraped course data and renamed accordingly")
-    _output_group = parser.add_mutually_exclusive_group()
-    _output_group.add_argument("-v", "--verbosity", action="count", default=0,
-                               help="increase output verbosity")
-    _output_group.add_argument("-q", "--quiet", action="count", default=0,
-                               help="decrease output verbosity")
+    _add_output_arguments(parser)
     parser.add_argument("-a", "--avidst", help="the full path to the "
                         "destination directory in which AVI files only should "
                         "be moved to", default=None)
@@ -551,7 +2091,135 @@ def _main():
                         "(without the seperator) that should be ignored when "
                         "renaming and moving files", default=("html", ),
                         nargs="*")
-    args = parser.parse_args()
+    parser.add_argument("--nojournal", help="do not journal moves, so that "
+                        "an interrupted chapter cannot be resumed or rolled "
+                        "back", action="store_true")
+    parser.add_argument("-r", "--rescan", help="examine entries in src even "
+                        "if they are unchanged since an earlier run recorded "
+                        "their outcome", action="store_true")
+    parser.add_argument("--verify", help="record the size and CRC-32 of each "
+                        "file, checked or computed as it is transferred, in "
+                        "a per-course manifest inside dst for the audit "
+                        "subcommand", action="store_true")
+    parser.add_argument("--dedup", help="store files that keep their original "
+                        "name once inside dst and link every identical copy "
+                        "to the stored one", action="store_true")
+    parser.add_argument("--store", help="with --dedup, the directory, on the "
+                        "same device as the files, to store them in instead, "
+                        "e.g. one outside a synced folder")
+    parser.add_argument("-x", "--extracourse", help="another course to "
+                        "organise from within the same scan of src, given as "
+                        "its course ID, chapter pattern and lesson pattern",
+                        action="append", default=[], nargs=3,
+                        metavar=("COURSE_ID", "CHAPTER_PATTERN",
+                                 "LESSON_PATTERN"))
+    if execute:
+        _add_execute_arguments(parser)
+
+
+def _add_execute_arguments(parser, workers=True):
+    if workers:
+        parser.add_argument("-w", "--workers", help="the number of chapters "
+                            "to organise concurrently", default=1, type=int)
+        parser.add_argument("--processes", help="use worker processes "
+                            "rather than threads", action="store_true")
+    parser.add_argument("-z", "--extractworkers", help="the number of threads "
+                        "to share the members of each chapter zip of 64 MiB "
+                        "or more among", default=1, type=int)
+    parser.add_argument("-b", "--devicelimit", help="cap the transfers to "
+                        "the device that a directory is on at a number of "
+                        "concurrent files and megabytes per second, where 0 "
+                        "means no cap", action="append", default=[], nargs=3,
+                        metavar=("DIRECTORY", "CONCURRENCY", "MBPS"))
+    parser.add_argument("--progress", help="show the files and bytes done, "
+                        "throughput and ETA on a single line of stderr, "
+                        "redrawn at most twice a second", action="store_true")
+    parser.add_argument("-e", "--encode", help="encode each AVI file to MP4 "
+                        "with this encoder as soon as it has been moved",
+                        choices=("mencoder", "avconv", "ffmpeg"), default=None)
+    parser.add_argument("-t", "--stats", help="the full path to a file to "
+                        "which the outcome and stage timings of each chapter "
+                        "should be appended as JSON lines", default=None)
+
+
+def _courses_with_patterns(args, level):
+    courses_with_patterns = [(Course.get(args.course_id, level),
+                              args.chapter_pattern, args.lesson_pattern)]
+    for course_id, chapter_pattern, lesson_pattern in args.extracourse:
+        courses_with_patterns.append((Course.get(int(course_id), level),
+                                      chapter_pattern, lesson_pattern))
+    return courses_with_patterns
+
+
+def _device_limits(args):
+    # Convert each -b DIRECTORY CONCURRENCY MBPS into the (concurrency,
+    # bytes_per_second) tuple expected by organise_many, with 0 as no cap.
+    device_limits = {}
+    for path, concurrency, mbps in args.devicelimit:
+        device_limits[path] = (int(concurrency) or None,
+                               float(mbps) * 1e6 or None)
+    return device_limits
+
+
+def _dedup(args):
+    # Convert --dedup and --store into the dedup argument of organise_many.
+    if args.dedup and args.store:
+        return args.store
+    return args.dedup
+
+
+def _progress(args):
+    # Return the report.Progress requested by --progress, if any.
+    if not args.progress:
+        return None
+    return report.Progress(_render_progress)
+
+
+def _render_progress(progress):
+    # Redraw the progress line in place.  report.Progress throttles the calls,
+    # so this costs nothing per buffer written.
+    eta = progress.eta()
+    if eta is None:
+        eta = "--:--:--"
+    else:
+        minutes, seconds = divmod(int(eta), 60)
+        eta = "%d:%02d:%02d" % (minutes // 60, minutes % 60, seconds)
+    chapter = progress.chapter
+    if isinstance(chapter, tuple):
+        chapter = "c%03dch%02d" % chapter
+    elif chapter is not None:
+        chapter = os.path.basename(chapter)
+    line = ("%s/%s files, %.1f/%.1f MB, %.1f MB/s (%.1f now), ETA %s, %s %s" %
+            (progress.files, progress.total_files, progress.size / 1e6,
+             progress.total_size / 1e6, progress.bytes_per_second() / 1e6,
+             progress.recent_bytes_per_second / 1e6, eta, progress.stage or
+             "", chapter or ""))
+    sys.stderr.write("\r%-79s%s" % (line[:79], "\n" if progress.finished
+                                    else ""))
+    sys.stderr.flush()
+
+
+def _run_with_encoder(args, function, progress=None):
+    # Call function with the encoder requested by -e, if any, and log what the
+    # encoder did once it has finished.
+    if args.encode is None:
+        return function(None)
+    start_time = time.time()
+    encode_workers = os.cpu_count() or 1
+    # Allow a couple of files per encoder process to queue up so that none of
+    # them waits for work, but no more.
+    with encode.Encoder(encode_workers, args.encode, encode_workers * 2,
+                        progress) as encoder:
+        result = function(encoder)
+    summaries = encoder.summaries()
+    for summary in summaries:
+        _logger.info(summary)
+    _logger.info("Organised and encoded %s files in %.1f seconds." %
+                 (len(summaries), time.time() - start_time))
+    return result
+
+
+def _level(args):
     _logginglevels = {
         -2: logging.DEBUG,
         -1: logging.INFO,
@@ -559,16 +2227,258 @@ def _main():
         2: logging.CRITICAL,
         3: logging.NOTSET
     }
-    level = None
     if args.quiet:
-        level = _logginglevels[min(max(_logginglevels), args.quiet)]
+        return _logginglevels[min(max(_logginglevels), args.quiet)]
     elif args.verbosity:
-        level = _logginglevels[max(min(_logginglevels), -args.verbosity)]
-    _course = Course.get(args.course_id, level)
-    _course.organise(args.src, args.dst, args.chapter_pattern,
-                     args.lesson_pattern, args.avidst, args.pdfdst,
-                     args.completedprefix, args.ignoredexts)
+        return _logginglevels[max(min(_logginglevels), -args.verbosity)]
+
+
+def _course_ids(value):
+    # Accept either a single course ID or an inclusive range such as 100-999.
+    first, separator, last = value.partition("-")
+    if not separator:
+        return [int(first)]
+    return list(range(int(first), int(last) + 1))
+
+
+def _prefetch_main(argv):
+    parser = argparse.ArgumentParser(prog="prefetch", description="Scrape "
+                                     "the course, chapter and lesson data for "
+                                     "many courses concurrently from "
+                                     "LearnItFirst.com and dump each course "
+                                     "to the catalogue.")
+    parser.add_argument("course_ids", help="the unique ID integers (between "
+                        "100 and 999) of the courses, or inclusive ranges of "
+                        "them such as 100-999", nargs="+", type=_course_ids)
+    _add_output_arguments(parser)
+    parser.add_argument("-n", "--concurrency", help="the maximum number of "
+                        "courses to scrape at once", default=4, type=int)
+    parser.add_argument("-m", "--mininterval", help="the minimum number of "
+                        "seconds between the start of two requests to "
+                        "LearnItFirst.com", default=0.5, type=float)
+    parser.add_argument("-r", "--refresh", help="scrape courses that already "
+                        "have course data again", action="store_true")
+    parser.add_argument("-o", "--offline", help="re-parse cached pages "
+                        "without making any request", action="store_true")
+    args = parser.parse_args(argv)
+    course_ids = [course_id for course_ids in args.course_ids for course_id
+                  in course_ids]
+    Course.prefetch(course_ids, args.concurrency, args.mininterval,
+                    args.refresh, args.offline, _level(args))
+
+
+def _rollback_main(argv):
+    parser = argparse.ArgumentParser(prog="rollback", description="Undo the "
+                                     "moves of every chapter whose "
+                                     "organisation into a destination "
+                                     "directory was interrupted.")
+    parser.add_argument("dst", help="the full path to the destination "
+                        "directory that was organised into")
+    _add_output_arguments(parser)
+    args = parser.parse_args(argv)
+    Course.rollback(args.dst, _level(args))
+
+
+def _audit_main(argv):
+    parser = argparse.ArgumentParser(prog="audit", description="Check the "
+                                     "files organised into a destination "
+                                     "directory with --verify against the "
+                                     "sizes and CRC-32s in their manifests.")
+    parser.add_argument("dst", help="the full path to the destination "
+                        "directory that was organised into")
+    _add_output_arguments(parser)
+    args = parser.parse_args(argv)
+    problems = Course.audit(args.dst, _level(args))
+    for path, problem in problems:
+        sys.stdout.write("%s: %s\n" % (path, problem))
+    return 1 if problems else 0
+
+
+def _enqueue_main(argv):
+    parser = argparse.ArgumentParser(prog="enqueue", description="Add the "
+                                     "course chapters in a source directory "
+                                     "to a job queue for worker processes, "
+                                     "on this or other hosts, to organise.")
+    parser.add_argument("queue", help="the full path to the queue's SQLite "
+                        "database, on storage shared by every worker")
+    _add_organise_arguments(parser, False)
+    args = parser.parse_args(argv)
+    _set_stderr_level(_level(args) or _DEFAULT_LEVEL)
+    course_ids_with_patterns = [(args.course_id, args.chapter_pattern,
+                                 args.lesson_pattern)]
+    for course_id, chapter_pattern, lesson_pattern in args.extracourse:
+        course_ids_with_patterns.append((int(course_id), chapter_pattern,
+                                         lesson_pattern))
+    added = enqueue_many(args.queue, course_ids_with_patterns, args.src,
+                         args.dst, args.avidst, args.pdfdst,
+                         args.completedprefix, args.ignoredexts,
+                         not args.nojournal, args.rescan, args.verify,
+                         _dedup(args))
+    sys.stdout.write("%s chapters added; %s\n" % (added, ", ".join(
+        "%s %s" % (count, state) for state, count in
+        jobs.JobQueue(args.queue).counts().items())))
+
+
+def _encode_main(argv):
+    parser = argparse.ArgumentParser(prog="encode", description="Encode every "
+                                     "AVI file within a directory tree to an "
+                                     "MP4 file alongside it, skipping files "
+                                     "that are already up to date.")
+    parser.add_argument("dir_name", help="the full path to the directory to "
+                        "be walked, e.g. the AVI destination directory")
+    _add_output_arguments(parser)
+    parser.add_argument("-w", "--workers", help="the maximum number of "
+                        "encoder processes to run at once; by default, the "
+                        "number of CPUs", default=None, type=int)
+    parser.add_argument("-e", "--encoder", help="the encoder program to run",
+                        choices=("mencoder", "avconv", "ffmpeg"),
+                        default="mencoder")
+    parser.add_argument("--progress", help="show the files and bytes done, "
+                        "throughput and ETA on a single line of stderr, "
+                        "redrawn at most twice a second", action="store_true")
+    args = parser.parse_args(argv)
+    _set_stderr_level(_level(args) or _DEFAULT_LEVEL)
+    progress = _progress(args)
+    try:
+        encode.encode(args.dir_name, args.workers, args.encoder, progress)
+    finally:
+        if progress is not None:
+            progress.finish()
+
+
+def _migrate_main(argv):
+    parser = argparse.ArgumentParser(prog="migrate", description="Load every "
+                                     "course from the JSON files inside "
+                                     "course_data into the catalogue.")
+    _add_output_arguments(parser)
+    args = parser.parse_args(argv)
+    Course.migrate(_level(args))
+
+
+def _watch_main(argv):
+    parser = argparse.ArgumentParser(prog="watch", description="Organise, "
+                                     "move and rename course chapters as "
+                                     "they finish arriving in a source "
+                                     "directory, until interrupted.")
+    _add_organise_arguments(parser)
+    parser.add_argument("-s", "--settletime", help="the number of seconds "
+                        "for which a chapter must be left unchanged before it "
+                        "is considered complete", default=10.0, type=float)
+    parser.add_argument("-l", "--pollinterval", help="the maximum number of "
+                        "seconds between checks of src", default=5.0,
+                        type=float)
+    args = parser.parse_args(argv)
+    courses_with_patterns = _courses_with_patterns(args, _level(args))
+    stats = report.RunStats(args.stats)
+    progress = _progress(args)
+    try:
+        _run_with_encoder(args, lambda encoder: watch_many(
+            courses_with_patterns, args.src, args.dst, args.avidst,
+            args.pdfdst, args.completedprefix, args.ignoredexts, args.workers,
+            args.processes, not args.nojournal, args.rescan, encoder,
+            args.settletime, args.pollinterval, stats=stats,
+            verify=args.verify, dedup=_dedup(args),
+            extract_workers=args.extractworkers,
+            device_limits=_device_limits(args), progress=progress), progress)
+    except KeyboardInterrupt:
+        _logger.info("Stopped watching %s." % args.src)
+    finally:
+        if progress is not None:
+            progress.finish()
+    _logger.info("Run report:\n%s", stats)
+
+
+def _worker_main(argv):
+    parser = argparse.ArgumentParser(prog="worker", description="Claim, "
+                                     "organise and acknowledge course "
+                                     "chapters from a job queue filled by "
+                                     "the enqueue subcommand, until "
+                                     "interrupted.")
+    parser.add_argument("queue", help="the full path to the queue's SQLite "
+                        "database, on storage shared by every worker")
+    _add_output_arguments(parser)
+    _add_execute_arguments(parser, False)
+    parser.add_argument("--lease", help="the number of seconds for which a "
+                        "chapter is leased, renewed whilst it is organised, "
+                        "before another worker may claim it", default=300.0,
+                        type=float)
+    parser.add_argument("-l", "--pollinterval", help="the number of seconds "
+                        "between checks of an empty queue", default=5.0,
+                        type=float)
+    parser.add_argument("--drain", help="stop once no chapter is pending or "
+                        "leased rather than waiting for more",
+                        action="store_true")
+    args = parser.parse_args(argv)
+    level = _level(args)
+    _set_stderr_level(level or _DEFAULT_LEVEL)
+    stats = report.RunStats(args.stats)
+    progress = _progress(args)
+    try:
+        _run_with_encoder(args, lambda encoder: work(
+            args.queue, drain=args.drain, lease_seconds=args.lease,
+            poll_interval=args.pollinterval, encoder=encoder, stats=stats,
+            extract_workers=args.extractworkers,
+            device_limits=_device_limits(args), progress=progress,
+            stderr_level_override=level), progress)
+    except KeyboardInterrupt:
+        _logger.info("Stopped working on the queue at %s." % args.queue)
+    finally:
+        if progress is not None:
+            progress.finish()
+    _logger.info("Run report:\n%s", stats)
+
+
+_SUBCOMMANDS = {
+    "audit": _audit_main,
+    "encode": _encode_main,
+    "enqueue": _enqueue_main,
+    "migrate": _migrate_main,
+    "prefetch": _prefetch_main,
+    "rollback": _rollback_main,
+    "watch": _watch_main,
+    "worker": _worker_main
+}
+
+
+def _main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in _SUBCOMMANDS:
+        return _SUBCOMMANDS[argv[0]](argv[1:])
+    parser = argparse.ArgumentParser(prog="liforganiser",
+                                     description="Scrape the course, chapter "
+                                     "and lesson data from LearnItFirst.com "
+                                     "and then organise, move and rename "
+                                     "pre-downloaded course chapters "
+                                     "accordingly.")
+    _add_organise_arguments(parser)
+    parser.add_argument("-d", "--dryrun", help="print the plan of what would "
+                        "be moved and skipped, and how many bytes would be "
+                        "written to or renamed on each device, without "
+                        "moving anything",
+                        action="store_true")
+    args = parser.parse_args(argv)
+    courses_with_patterns = _courses_with_patterns(args, _level(args))
+    stats = report.RunStats(args.stats)
+    if args.dryrun:
+        plan = _plan_many(courses_with_patterns, args.src, args.dst,
+                          args.avidst, args.pdfdst, args.ignoredexts,
+                          args.rescan, stats=stats)
+        sys.stdout.write("%s\n" % plan)
+        return
+    progress = _progress(args)
+    try:
+        _run_with_encoder(args, lambda encoder: organise_many(
+            courses_with_patterns, args.src, args.dst, args.avidst,
+            args.pdfdst, args.completedprefix, args.ignoredexts, args.workers,
+            args.processes, not args.nojournal, args.rescan, encoder, stats,
+            args.verify, _dedup(args), args.extractworkers,
+            _device_limits(args), progress), progress)
+    finally:
+        if progress is not None:
+            progress.finish()
+    _logger.info("Run report:\n%s", stats)
 
 
 if __name__ == "__main__":
-    _main()
+    sys.exit(_main())
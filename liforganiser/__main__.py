@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+
+"""Runs the liforganiser command line interface, as python -m liforganiser.
+"""
+
+import sys
+
+import liforganiser
+
+
+sys.exit(liforganiser._main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+"""Provides the SQLite course catalogue used by liforganiser.Course to store
+scraped course data in a single file, indexed by course, chapter and lesson,
+so that a course's chapters can be loaded lazily one at a time.
+
+This module exports the following names only:
+class Catalogue -- A single-file catalogue of course, chapter and lesson
+    names with an in-process LRU cache of chapter lessons.
+function open_catalogue -- Return the Catalogue for a path, shared by every
+    caller in the process.
+
+View each name's docstring for more verbose information.
+"""
+
+import functools
+import os
+import sqlite3
+import threading
+
+
+_DB_PATH = os.path.join(os.path.dirname(__file__), "course_data",
+                        "catalogue" + os.extsep + "sqlite3")
+# The composite primary keys double as the indexes; WITHOUT ROWID stores each
+# table clustered on them so a chapter's lessons sit together on disk.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courses (
+    course_id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    course_id INTEGER NOT NULL,
+    num INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (course_id, num)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS lessons (
+    course_id INTEGER NOT NULL,
+    chapter_num INTEGER NOT NULL,
+    num INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (course_id, chapter_num, num)
+) WITHOUT ROWID;
+"""
+_catalogues = {}
+_catalogues_lock = threading.Lock()
+
+
+class Catalogue(object):
+    """A single-file catalogue of course, chapter and lesson names with an
+    in-process LRU cache of chapter lessons that is invalidated on write.
+
+    Keyword arguments:
+    path -- the full path to the SQLite database file, which is created if it
+        does not exist.  If no value is passed, ./course_data/catalogue.sqlite3
+        is used (default None)
+    cache_size -- the maximum number of chapters whose lessons are kept in
+        the LRU cache (default 256)
+
+    The instance variables are as follows:
+    self.path -- as above
+
+    The public methods are as follows:
+    method course_ids -- Return a sorted list of the catalogued course IDs.
+    method course -- Return the title and chapter names of a course.
+    method lessons -- Return the lesson names of a chapter.
+    method write -- Replace all of the data for a course.
+    """
+
+    def __init__(self, path=None, cache_size=256):
+        self.path = path or _DB_PATH
+        self._local = threading.local()
+        self._lessons = functools.lru_cache(cache_size)(self._query_lessons)
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads, so each thread
+        # opens its own.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def course_ids(self):
+        """Return a sorted list of the catalogued course IDs."""
+        rows = self._connection().execute("SELECT course_id FROM courses "
+                                          "ORDER BY course_id")
+        return [course_id for course_id, in rows]
+
+    def course(self, course_id):
+        """Return a (title, chapter_names) tuple for a course where
+        chapter_names is a dict mapping chapter numbers to names, or None if
+        the course is not catalogued.
+
+        Keyword arguments:
+        course_id -- the unique ID integer (between 100 and 999) of the course
+        """
+        connection = self._connection()
+        row = connection.execute("SELECT title FROM courses WHERE "
+                                 "course_id = ?", (course_id,)).fetchone()
+        if row is None:
+            return None
+        rows = connection.execute("SELECT num, name FROM chapters WHERE "
+                                  "course_id = ?", (course_id,))
+        return row[0], dict(rows)
+
+    def _query_lessons(self, course_id, chapter_num):
+        rows = self._connection().execute("SELECT num, name FROM lessons "
+                                          "WHERE course_id = ? AND "
+                                          "chapter_num = ?",
+                                          (course_id, chapter_num))
+        return tuple(rows)
+
+    def lessons(self, course_id, chapter_num):
+        """Return a dict mapping lesson numbers to names for a chapter.
+
+        Keyword arguments:
+        course_id -- the unique ID integer (between 100 and 999) of the course
+        chapter_num -- the number of the chapter within the course
+        """
+        return dict(self._lessons(course_id, chapter_num))
+
+    def write(self, course_id, title, chapters):
+        """Replace all of the data for a course.
+
+        Keyword arguments:
+        course_id -- the unique ID integer (between 100 and 999) of the course
+        title -- the full name of the course
+        chapters -- a dict mapping chapter numbers to (name, lessons) tuples
+            where lessons is a dict mapping lesson numbers to names
+        """
+        connection = self._connection()
+        with connection:
+            for table in ("lessons", "chapters", "courses"):
+                connection.execute("DELETE FROM %s WHERE course_id = ?" %
+                                   table, (course_id,))
+            connection.execute("INSERT INTO courses VALUES (?, ?)",
+                               (course_id, title))
+            connection.executemany("INSERT INTO chapters VALUES (?, ?, ?)",
+                                   ((course_id, chapter_num, name) for
+                                    chapter_num, (name, lessons) in
+                                    chapters.items()))
+            connection.executemany("INSERT INTO lessons VALUES (?, ?, ?, ?)",
+                                   ((course_id, chapter_num, lesson_num,
+                                     lesson_name) for chapter_num,
+                                    (name, lessons) in chapters.items() for
+                                    lesson_num, lesson_name in
+                                    lessons.items()))
+        self._lessons.cache_clear()
+
+
+def open_catalogue(path=None):
+    """Return the Catalogue for a path, shared by every caller in the process
+    so that they share its LRU cache.
+
+    Keyword arguments:
+    path -- as described for Catalogue (default None)
+    """
+    path = path or _DB_PATH
+    with _catalogues_lock:
+        catalogue = _catalogues.get(path)
+        if catalogue is None:
+            catalogue = _catalogues[path] = Catalogue(path)
+        return catalogue
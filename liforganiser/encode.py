@@ -1,17 +1,262 @@
+#!/usr/bin/env python3
+
+"""Provides the transcoding layer used to encode organised AVI lessons into
+MP4 files with a bounded pool of encoder processes, longest files first, so
+that a course's lessons keep every core busy until the last one finishes.
+
+This module exports the following names only:
+class Encoder -- A bounded pool of encoder processes which transcode AVI
+    files into MP4 files alongside them.
+function encode -- Encode every AVI file within a directory tree and return
+    a list of per-file summaries.
+
+View each name's docstring for more verbose information.
+"""
+
+from concurrent import futures
+import logging
 import os
+import shutil
+import subprocess
+import threading
+import time
+
+
+# Each command is built as an argument list rather than a shell string so that
+# lesson names containing quotes or other shell characters are passed intact.
+_COMMANDS = {
+    "mencoder": ("mencoder", "%(src)s", "-o", "%(dst)s", "-oac", "mp3lame",
+                 "-ovc", "x264"),
+    "avconv": ("avconv", "-i", "%(src)s", "-c:a", "mp3", "-c:v", "mpeg4",
+               "%(dst)s"),
+    "ffmpeg": ("ffmpeg", "-nostdin", "-i", "%(src)s", "-c:a", "libmp3lame",
+               "-c:v", "mpeg4", "%(dst)s")
+}
+_logger = logging.getLogger(__name__)
+
+
+class _Encoding(object):
+    def __init__(self, src_path, dst_path, status, size=0, seconds=0.0,
+                 reason=None):
+        self.src_path = src_path
+        self.dst_path = dst_path
+        self.status = status
+        self.size = size
+        self.seconds = seconds
+        self.reason = reason
+
+    def __str__(self):
+        if self.reason is not None:
+            return "%s: %s; %s." % (self.src_path, self.status, self.reason)
+        return ("%s: %s; %s bytes in %.1f seconds at %.2f MB/s." %
+                (self.src_path, self.status, self.size, self.seconds,
+                 self.size / self.seconds / 1e6 if self.seconds else 0.0))
+
+
+class Encoder(object):
+    """A bounded pool of encoder processes which transcode AVI files into MP4
+    files alongside them.  Files whose MP4 file is already newer than them are
+    skipped, and each MP4 file is written under a temporary name and renamed
+    into place once complete so that an interrupted encode is never mistaken
+    for a finished one.
+
+    Keyword arguments:
+    workers -- the maximum number of encoder processes to run at once.  If no
+        value is passed, the number of CPUs is used (default None)
+    encoder -- the encoder program to run; one of "mencoder", "avconv" or
+        "ffmpeg" (default "mencoder")
+    max_pending -- the maximum number of files that may be queued or encoding
+        at once, beyond which submit() blocks so that a producer such as
+        Course.execute cannot run arbitrarily far ahead of the encoders.  If
+        no value is passed, the queue is unbounded (default None)
+    progress -- a report.Progress to which each file submitted is added as
+        expected, and each file encoded, skipped or failed is added as done
+        in the "encode" stage under its directory (default None)
+
+    The instance variables are as follows:
+    self.workers -- as above
+    self.encoder -- as above
+    self.max_pending -- as above
+    self.progress -- as above
+
+    Encoder objects can be used as context managers, which call close() on
+    exit, first calling cancel() if an exception was raised.
+
+    The public methods are as follows:
+    method submit -- Queue an AVI file to be encoded.
+    method close -- Wait for every queued file to be encoded.
+    method cancel -- Cancel every queued file that has not started encoding.
+    method summaries -- Return the summaries of the files encoded so far.
+    """
 
+    def __init__(self, workers=None, encoder="mencoder", max_pending=None,
+                 progress=None):
+        if encoder not in _COMMANDS:
+            _logger.critical("Unknown encoder, %s.", encoder)
+            raise ValueError("unknown encoder, %s" % encoder)
+        if shutil.which(_COMMANDS[encoder][0]) is None:
+            _logger.critical("The encoder, %s, cannot be found on the PATH.",
+                             encoder)
+            raise OSError("encoder, %s, cannot be found" % encoder)
+        self.workers = workers or os.cpu_count() or 1
+        self.encoder = encoder
+        self.max_pending = max_pending
+        self.progress = progress
+        if max_pending is None:
+            self._slots = None
+        else:
+            self._slots = threading.BoundedSemaphore(max_pending)
+        # The encoding happens in the child processes, so threads that simply
+        # wait on them are all the pool needs.
+        self._executor = futures.ThreadPoolExecutor(self.workers)
+        self._futures = []
+        self._lock = threading.Lock()
 
-def encode(dir_name):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.cancel()
+        self.close()
+
+    @classmethod
+    def _dst_path(cls, src_path):
+        return os.path.splitext(src_path)[0] + os.extsep + "mp4"
+
+    def _encode(self, src_path):
+        # A file that cannot be encoded at all, e.g. because it was removed
+        # after being queued or the encoder could not be started, is failed
+        # like any other so that summaries() never raises.
+        try:
+            encoding = self._encode_file(src_path)
+        except Exception as error:
+            _logger.error("%s could not be encoded: %s", src_path, error)
+            try:
+                size = os.path.getsize(src_path)
+            except OSError:
+                size = 0
+            encoding = _Encoding(src_path, self._dst_path(src_path),
+                                 "failed", size, reason="%s: %s" % (
+                                     type(error).__name__, error))
+        if self.progress is not None:
+            self.progress.add(os.path.dirname(src_path), "encode",
+                              encoding.size, 1)
+        return encoding
+
+    def _encode_file(self, src_path):
+        dst_path = self._dst_path(src_path)
+        src_stat = os.stat(src_path)
+        try:
+            up_to_date = os.stat(dst_path).st_mtime >= src_stat.st_mtime
+        except OSError:
+            up_to_date = False
+        if up_to_date:
+            _logger.debug("%s is already up to date.", dst_path)
+            return _Encoding(src_path, dst_path, "skipped", src_stat.st_size,
+                             reason="already up to date")
+        head, tail = os.path.split(dst_path)
+        # The temporary name keeps the extension, from which avconv and ffmpeg
+        # choose the container.
+        temp_path = os.path.join(head, "." + os.path.splitext(tail)[0] +
+                                 os.extsep + "part" + os.extsep + "mp4")
+        command = [argument % {"src": src_path, "dst": temp_path} for
+                   argument in _COMMANDS[self.encoder]]
+        _logger.info("Encoding %s.", src_path)
+        start_time = time.time()
+        try:
+            process = subprocess.run(command, stdin=subprocess.DEVNULL,
+                                     stdout=subprocess.DEVNULL,
+                                     stderr=subprocess.PIPE)
+            if process.returncode == 0:
+                os.replace(temp_path, dst_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        seconds = time.time() - start_time
+        if process.returncode != 0:
+            message = process.stderr.decode("utf-8", "replace").strip()
+            _logger.error("%s failed to encode %s with exit status %s: %s",
+                          self.encoder, src_path, process.returncode,
+                          message.splitlines()[-1] if message else "")
+            return _Encoding(src_path, dst_path, "failed", src_stat.st_size,
+                             seconds, "exit status %s" % process.returncode)
+        return _Encoding(src_path, dst_path, "encoded", src_stat.st_size,
+                         seconds)
+
+    def submit(self, src_path):
+        """Queue an AVI file to be encoded, first waiting for a free slot if
+        max_pending files are already pending, and return a
+        concurrent.futures.Future whose result is the file's summary.
+
+        Keyword arguments:
+        src_path -- the full path to the AVI file, which is encoded to a file
+            of the same name with an MP4 extension
+        """
+        if self.progress is not None:
+            self.progress.add_total(os.path.dirname(src_path), 1,
+                                    os.path.getsize(src_path))
+        if self._slots is not None:
+            self._slots.acquire()
+        future = self._executor.submit(self._encode, src_path)
+        if self._slots is not None:
+            future.add_done_callback(lambda future: self._slots.release())
+        with self._lock:
+            self._futures.append(future)
+        return future
+
+    def close(self):
+        """Wait for every queued file to be encoded and shut the pool down."""
+        self._executor.shutdown(wait=True)
+
+    def cancel(self):
+        """Cancel every queued file that has not started encoding, e.g. when
+        organising has failed.  Files already being encoded are finished.
+        """
+        with self._lock:
+            pending = list(self._futures)
+        for future in pending:
+            future.cancel()
+
+    def summaries(self):
+        """Return a list of the summaries of the files encoded, skipped or
+        failed so far, in the order they were submitted.
+        """
+        with self._lock:
+            pending = list(self._futures)
+        return [future.result() for future in pending if future.done() and
+                not future.cancelled()]
+
+
+def encode(dir_name, workers=None, encoder="mencoder", progress=None):
+    """Encode every AVI file within a directory tree to an MP4 file alongside
+    it and return a list of per-file summaries, largest file first.
+
+    Keyword arguments:
+    dir_name -- the full path to the directory to be walked
+    workers, encoder, progress -- as described for Encoder
+    """
+    src_paths = []
     for root, dir_names, file_names in os.walk(dir_name):
         for file_name in file_names:
             split_ext = os.path.splitext(file_name)
             if len(split_ext) > 1 and split_ext[-1][1:].lower() == "avi":
-                os.system("mencoder \"%s\" -o \"%s\" -oac mp3lame -ovc x264" %
-                          (os.path.join(root, file_name),
-                           os.path.join(root, split_ext[0] + os.path.extsep +
-                                        "mp4")))
-
-"""
-mencoder "c160ch01l03 - Why this Course is So Important: Is It the Greatest Course Ever?.avi" -o "c160ch01l03 - Why this Course is So Important: Is It the Greatest Course Ever?.mp4" -oac mp3lame -ovc x264
-avconv -i "c160ch01l03 - Why this Course is So Important: Is It the Greatest Course Ever?.avi" -c:a mp3 -c:v mpeg4 "c160ch01l03 - Why this Course is So Important: Is It the Greatest Course Ever?.mp4"
-"""
+                src_paths.append(os.path.join(root, file_name))
+    # The file size stands in for the duration; starting the longest encodes
+    # first stops one long lesson from being left to run on its own at the
+    # end.
+    src_paths.sort(key=os.path.getsize, reverse=True)
+    start_time = time.time()
+    with Encoder(workers, encoder, progress=progress) as encoder_pool:
+        for src_path in src_paths:
+            encoder_pool.submit(src_path)
+    summaries = encoder_pool.summaries()
+    for summary in summaries:
+        _logger.info(summary)
+    encoded = [summary for summary in summaries if summary.status ==
+               "encoded"]
+    _logger.info("Encoded %s of %s files (%s bytes) in %.1f seconds.",
+                 len(encoded), len(summaries),
+                 sum(summary.size for summary in encoded),
+                 time.time() - start_time)
+    return summaries
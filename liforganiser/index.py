@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""Provides the source index used by liforganiser.Course.organise to remember
+the outcome of each entry in a source directory, so that a later run can skip
+entries that are unchanged since then with a single stat rather than opening,
+walking and validating them again.
+
+This module exports the following names only:
+class SourceIndex -- A persistent record of source entries, keyed by path
+    and identified by size, modification time and inode, and their outcomes.
+function identity -- Return the size, modification time and inode that
+    identify a source entry.
+
+View each name's docstring for more verbose information.
+"""
+
+import json
+import os
+
+from liforganiser import transfer
+
+
+class SourceIndex(object):
+    """A persistent record of source entries, keyed by path and identified by
+    size, modification time and inode, and the outcome of each, i.e.
+    "organised", "skipped" or "mismatched".  Any number of threads,
+    processes and hosts can share an index: saving takes an exclusive lock on
+    a file beside it and merges the outcomes recorded since into the file as
+    it is then, so that no other saver's outcomes are lost.
+
+    Keyword arguments:
+    path -- the full path to the JSON file holding the index, which is
+        created when the index is first saved
+
+    The instance variables are as follows:
+    self.path -- as above
+
+    The public methods are as follows:
+    method lookup -- Return the recorded outcome of an unchanged entry.
+    method record -- Record the outcome of an entry.
+    method save -- Merge the recorded outcomes into the index's file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = None
+        # The entries recorded since the index was last saved.
+        self._changes = {}
+
+    def _load(self):
+        # The file is only read once it is needed so that constructing an
+        # index for a dry run or an empty source directory costs nothing.
+        if self._entries is None:
+            self._entries = self._read()
+        return self._entries
+
+    def _read(self):
+        try:
+            with open(self.path) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def lookup(self, path, stat):
+        """Return the recorded outcome of an entry, or None if the entry is
+        not recorded or has changed since its outcome was recorded.
+
+        Keyword arguments:
+        path -- the absolute path to the entry
+        stat -- the os.stat_result of the entry
+        """
+        entry = self._load().get(path)
+        if entry is None or entry[:3] != identity(path, stat):
+            return None
+        return entry[3]
+
+    def record(self, path, stat, outcome):
+        """Record the outcome of an entry.
+
+        Keyword arguments:
+        path -- the absolute path to the entry
+        stat -- the os.stat_result of the entry once the outcome was reached
+        outcome -- a string describing what happened to the entry
+        """
+        entry = identity(path, stat) + [outcome]
+        self._load()[path] = self._changes[path] = entry
+
+    def save(self):
+        """Merge the outcomes recorded since the index was last saved into its
+        file, under a lock, replacing the file atomically.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + os.extsep + "lock", "a") as lock_fp:
+            transfer.lock_file(lock_fp)
+            entries = self._read()
+            entries.update(self._changes)
+            transfer.replace_file(self.path, json.dumps(entries))
+        self._entries = entries
+        self._changes = {}
+
+
+def identity(path, stat):
+    """Return a [size, mtime_ns, inode] list that identifies a source entry
+    and changes whenever the entry does.  For a directory, size is the total
+    size of the files in its tree and mtime_ns the latest modification time
+    of any entry in the tree, the directory included, so that a change to a
+    file in a nested directory changes the identity too.
+
+    Keyword arguments:
+    path -- the full path to the entry
+    stat -- the os.stat_result of the entry
+    """
+    if not os.path.isdir(path):
+        return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+    size, mtime_ns = 0, stat.st_mtime_ns
+    dir_paths = [path]
+    while dir_paths:
+        try:
+            for entry in os.scandir(dir_paths.pop()):
+                try:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                mtime_ns = max(mtime_ns, entry_stat.st_mtime_ns)
+                if entry.is_dir(follow_symlinks=False):
+                    dir_paths.append(entry.path)
+                else:
+                    size += entry_stat.st_size
+        except OSError:
+            continue
+    return [size, mtime_ns, stat.st_ino]
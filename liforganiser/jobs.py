@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+"""Provides the job queue used by liforganiser.enqueue_many and
+liforganiser.work to share the organising of chapters among any number of
+worker processes, on any number of hosts, through a single SQLite database on
+shared storage.
+
+This module exports the following name only:
+class JobQueue -- A queue of chapters to be organised, claimed by workers
+    under leases that expire if a worker stops renewing them.
+
+View each name's docstring for more verbose information.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from liforganiser import index
+
+
+# The identity columns, from index.identity, let enqueue() recognise an entry
+# that already has a job without the workers' index files.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY,
+    course_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    options TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+CREATE INDEX IF NOT EXISTS jobs_path ON jobs (path);
+"""
+_STATES = ("pending", "leased", "done", "failed")
+
+
+class _Job(object):
+    def __init__(self, job_id, course_id, path, options, attempts, owner):
+        self.job_id = job_id
+        self.course_id = course_id
+        self.path = path
+        self.options = options
+        self.attempts = attempts
+        self.owner = owner
+
+    def __str__(self):
+        return "Job %s (course ID, %s, %s; attempt %s)" % (
+            self.job_id, self.course_id, self.path, self.attempts)
+
+
+class JobQueue(object):
+    """A queue of chapters to be organised, claimed by workers under leases
+    that expire if a worker stops renewing them, so that the chapters of a
+    crashed worker are claimed again.  Every change is made in its own
+    immediate transaction, so any number of threads, processes and hosts can
+    share a queue.  SQLite's rollback journal is used rather than WAL, which
+    needs shared memory that a network file system cannot provide.
+
+    Keyword arguments:
+    path -- the full path to the SQLite database file, which is created if it
+        does not exist
+    max_attempts -- the number of times a job is claimed before a failure or
+        an expired lease marks it failed rather than pending (default 3)
+
+    The instance variables are as follows:
+    self.path -- as above
+    self.max_attempts -- as above
+
+    The public methods are as follows:
+    method enqueue -- Add a chapter to the queue unless it already has a job.
+    method claim -- Lease the next pending job.
+    method renew -- Extend the lease on a job.
+    method ack -- Mark a job done.
+    method fail -- Return a failed job to the queue or mark it failed.
+    method release -- Return a job to the queue without counting the attempt.
+    method counts -- Return the number of jobs in each state.
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+    def _connection(self):
+        # SQLite connections cannot be shared between threads, so each thread
+        # opens its own.  Transactions are begun explicitly.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            dir_path = os.path.dirname(self.path)
+            if dir_path:
+                os.makedirs(dir_path, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=60,
+                                         isolation_level=None)
+            connection.execute("PRAGMA journal_mode=DELETE")
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, function, *args):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers can
+        # never both read a job as pending and then both claim it.
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = function(connection, *args)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return result
+
+    def enqueue(self, course_id, path, stat, options):
+        """Add a chapter to the queue and return True, or return False if the
+        chapter, unchanged since, already has a job that has not failed.
+
+        Keyword arguments:
+        course_id -- the unique ID integer (between 100 and 999) of the course
+        path -- the absolute path to the chapter's directory or zip file
+        stat -- the os.stat_result of the chapter
+        options -- a JSON serialisable dict of the arguments with which the
+            chapter should be organised
+        """
+        identity = tuple(index.identity(path, stat))
+
+        def enqueue(connection):
+            for row in connection.execute("SELECT size, mtime_ns, ino FROM "
+                                          "jobs WHERE path = ? AND state != "
+                                          "'failed'", (path,)):
+                if row == identity:
+                    return False
+            connection.execute("INSERT INTO jobs (course_id, path, size, "
+                               "mtime_ns, ino, options, state, updated) "
+                               "VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
+                               (course_id, path) + identity +
+                               (json.dumps(options), time.time()))
+            return True
+
+        return self._transaction(enqueue)
+
+    def claim(self, owner, lease_seconds):
+        """Lease the next pending job, or a leased job whose lease has
+        expired, to a worker and return it, or return None if there is none.
+        The job has the instance variables job_id, course_id, path, options,
+        attempts and owner.
+
+        Keyword arguments:
+        owner -- a string identifying the worker, unique across hosts
+        lease_seconds -- the number of seconds for which the job is leased
+            unless renewed
+        """
+        def claim(connection):
+            now = time.time()
+            # A job whose lease expired on its last attempt is failed rather
+            # than claimed yet again.
+            connection.execute("UPDATE jobs SET state = 'failed', owner = "
+                               "NULL, result = 'lease expired', updated = ? "
+                               "WHERE state = 'leased' AND lease_expires < ? "
+                               "AND attempts >= ?", (now, now,
+                                                     self.max_attempts))
+            row = connection.execute("SELECT job_id, course_id, path, "
+                                     "options, attempts FROM jobs WHERE "
+                                     "state = 'pending' OR (state = 'leased' "
+                                     "AND lease_expires < ?) ORDER BY job_id "
+                                     "LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            job_id, course_id, path, options, attempts = row
+            connection.execute("UPDATE jobs SET state = 'leased', owner = ?, "
+                               "lease_expires = ?, attempts = ?, updated = ? "
+                               "WHERE job_id = ?", (owner, now + lease_seconds,
+                                                    attempts + 1, now, job_id))
+            return _Job(job_id, course_id, path, json.loads(options),
+                        attempts + 1, owner)
+
+        return self._transaction(claim)
+
+    def _update(self, job, state, lease_expires=None, result=None,
+                attempts=None, identity=(None, None, None)):
+        # Change a job only while its owner still holds the lease, and return
+        # whether it did.
+        def update(connection):
+            cursor = connection.execute(
+                "UPDATE jobs SET state = ?, owner = ?, lease_expires = ?, "
+                "result = ?, attempts = COALESCE(?, attempts), size = "
+                "COALESCE(?, size), mtime_ns = COALESCE(?, mtime_ns), ino = "
+                "COALESCE(?, ino), updated = ? WHERE job_id = ? AND owner = ? "
+                "AND state = 'leased'",
+                (state, job.owner if state == "leased" else None,
+                 lease_expires, result, attempts) + tuple(identity) +
+                (time.time(), job.job_id, job.owner))
+            return cursor.rowcount == 1
+
+        return self._transaction(update)
+
+    def renew(self, job, lease_seconds):
+        """Extend the lease on a job and return True, or return False if the
+        lease has been lost, e.g. because it expired and another worker
+        claimed the job.
+
+        Keyword arguments:
+        job -- a job returned by claim()
+        lease_seconds -- the number of seconds from now for which the job is
+            leased
+        """
+        return self._update(job, "leased", time.time() + lease_seconds)
+
+    def ack(self, job, result=None, stat=None):
+        """Mark a job done and return True, or return False if the lease has
+        been lost.
+
+        Keyword arguments:
+        job -- a job returned by claim()
+        result -- a string describing the outcome (default None)
+        stat -- the os.stat_result of the chapter once organised, if it is
+            still in the source directory, so that enqueue() recognises it as
+            unchanged since (default None)
+        """
+        if stat is None:
+            return self._update(job, "done", result=result)
+        return self._update(job, "done", result=result,
+                            identity=index.identity(job.path, stat))
+
+    def fail(self, job, reason):
+        """Return a failed job to the queue, or mark it failed once it has
+        been attempted max_attempts times, and return True, or return False if
+        the lease has been lost.
+
+        Keyword arguments:
+        job -- a job returned by claim()
+        reason -- a string describing the failure
+        """
+        state = "failed" if job.attempts >= self.max_attempts else "pending"
+        return self._update(job, state, result=reason)
+
+    def release(self, job):
+        """Return a job to the queue without counting the attempt, e.g. when
+        its worker is stopped, and return whether the lease was still held.
+
+        Keyword arguments:
+        job -- a job returned by claim()
+        """
+        return self._update(job, "pending", attempts=job.attempts - 1)
+
+    def counts(self):
+        """Return a dict mapping each state, i.e. "pending", "leased", "done"
+        and "failed", to the number of jobs in it.
+        """
+        counts = dict.fromkeys(_STATES, 0)
+        counts.update(self._connection().execute("SELECT state, COUNT(*) "
+                                                 "FROM jobs GROUP BY state"))
+        return counts
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""Provides the per-course manifests written by liforganiser.Course.organise
+when verifying transfers, recording the size and CRC-32 of every file as it
+was transferred so that a later audit only needs to read the destination.
+
+This module exports the following name only:
+class Manifest -- An append-only record of the files organised for a course
+    with their sizes and CRC-32 checksums.
+
+View each name's docstring for more verbose information.
+"""
+
+import json
+import logging
+import os
+import zlib
+
+from liforganiser import transfer
+
+
+_BUFFER_SIZE = 8 * 1024 * 1024
+_logger = logging.getLogger(__name__)
+
+
+class Manifest(object):
+    """An append-only record of the files organised for a course with their
+    sizes and CRC-32 checksums, one JSON document per line.  A file organised
+    more than once is described by its latest line.  Each append holds an
+    exclusive lock on the manifest, so workers on any number of hosts can
+    share one.
+
+    Keyword arguments:
+    path -- the full path to the manifest file, which is created when the
+        first entries are appended
+
+    The instance variables are as follows:
+    self.path -- as above
+
+    The public methods are as follows:
+    method append -- Append entries to the manifest.
+    method read -- Return the latest entry for each file.
+    method audit -- Check every file against its entry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def append(self, entries):
+        """Append entries to the manifest.
+
+        Keyword arguments:
+        entries -- an iterable of (path, size, crc32) tuples where crc32 is
+            an integer, or None if the file was renamed on its own device
+            rather than copied and so was never read
+        """
+        lines = [json.dumps({"path": path, "size": size, "crc32": None if
+                             crc32 is None else "%08x" % crc32}) + "\n" for
+                 path, size, crc32 in entries]
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a") as fp:
+            # Appends are not atomic on a network file system, so the lock
+            # stops the lines of two workers from interleaving.  It is
+            # released when the file is closed.
+            transfer.lock_file(fp)
+            fp.write("".join(lines))
+
+    def read(self):
+        """Return a dict mapping the path of each file in the manifest to a
+        (size, crc32) tuple from its latest entry.
+        """
+        entries = {}
+        try:
+            with open(self.path) as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A torn line from an interrupted run.
+                    crc32 = entry["crc32"]
+                    entries[entry["path"]] = (entry["size"], None if crc32 is
+                                              None else int(crc32, 16))
+        except OSError:
+            pass
+        return entries
+
+    def audit(self):
+        """Check every file in the manifest against its latest entry and
+        return a list of (path, problem) tuples for those that are missing,
+        have changed size or no longer match their CRC-32.  Files recorded
+        without a CRC-32 only have their size checked.
+        """
+        problems = []
+        entries = self.read()
+        for path, (size, crc32) in sorted(entries.items()):
+            try:
+                actual_size = os.path.getsize(path)
+            except OSError:
+                problems.append((path, "missing"))
+                continue
+            if actual_size != size:
+                problems.append((path, "%s bytes rather than %s" %
+                                 (actual_size, size)))
+                continue
+            if crc32 is None:
+                continue
+            actual_crc32 = 0
+            with open(path, "rb") as fp:
+                while True:
+                    buffer = fp.read(_BUFFER_SIZE)
+                    if not buffer:
+                        break
+                    actual_crc32 = zlib.crc32(buffer, actual_crc32)
+            if actual_crc32 != crc32:
+                problems.append((path, "CRC-32 %08x rather than %08x" %
+                                 (actual_crc32, crc32)))
+        _logger.info("Audited %s files against %s; %s problems found." %
+                     (len(entries), self.path, len(problems)))
+        return problems
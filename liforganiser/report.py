@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+"""Provides the run report collected by liforganiser.Course.from_url and
+liforganiser.Course.organise: the time spent in each stage of scraping and
+organising, and the files and bytes transferred to each destination, along
+with the live progress of organising and encoding.
+
+This module exports the following names only:
+class RunStats -- Accumulates per-stage timings and per-destination transfer
+    totals, optionally writing each event as a JSON line.
+class Progress -- Counts the files and bytes done per stage and per chapter
+    and reports them, with throughput and ETA, to a throttled callback.
+
+View each name's docstring for more verbose information.
+"""
+
+import contextlib
+import json
+import threading
+import time
+
+from liforganiser import transfer
+
+
+# The stages in the order that they happen, which is the order they are
+# reported in.
+_STAGES = ("http", "parse", "zip open", "walk", "validate", "extract", "move",
+           "dedup", "cleanup")
+
+
+class RunStats(object):
+    """Accumulates per-stage timings and per-destination transfer totals,
+    optionally writing each event as a JSON line.  A single instance may be
+    shared by any number of threads and passed to several calls.
+
+    Keyword arguments:
+    jsonl_path -- the full path to a file to which a JSON document is
+        appended, one per line, for each chapter organised or skipped and for
+        the running totals at the end of each call to Course.execute.  If no
+        value is passed, nothing is written (default None)
+
+    The instance variables are as follows:
+    self.jsonl_path -- as above
+    self.stages -- a dict mapping each stage to a two item list of the number
+        of times it was timed and the seconds spent in it.  The stages are
+        "http", "parse", "zip open", "walk", "validate", "extract", "move",
+        "dedup" and "cleanup"
+    self.destinations -- a dict mapping each destination to a five item
+        list of the files transferred to it, the bytes written to it, the
+        bytes renamed into it on their own device and the wall clock times at
+        which the first write to it started and the last ended, or None if
+        nothing was written
+
+    Converting the object to a string reports all of the above.
+
+    The public methods are as follows:
+    method time -- Return a context manager which times a stage.
+    method add_stage -- Add time spent in a stage.
+    method add_transfer -- Add files transferred to a destination.
+    method write -- Append a JSON document to the JSON lines file.
+    method as_dict -- Return the statistics as a dict.
+    """
+
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self.stages = {}
+        self.destinations = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        """Return a context manager which adds the time spent within it to a
+        stage.
+
+        Keyword arguments:
+        stage -- the name of the stage
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(stage, time.perf_counter() - start_time)
+
+    def add_stage(self, stage, seconds, count=1):
+        """Add time spent in a stage.
+
+        Keyword arguments:
+        stage -- the name of the stage
+        seconds -- the number of seconds spent in it
+        count -- the number of times it was timed (default 1)
+        """
+        with self._lock:
+            totals = self.stages.setdefault(stage, [0, 0.0])
+            totals[0] += count
+            totals[1] += seconds
+
+    def add_transfer(self, destination, files, stats):
+        """Add files transferred to a destination.
+
+        Keyword arguments:
+        destination -- the destination root directory
+        files -- the number of files transferred
+        stats -- a four item list of the bytes written, the bytes renamed and
+            the wall clock times of the first write's start and the last
+            write's end, as kept by transfer.Transferer
+        """
+        with self._lock:
+            totals = self.destinations.setdefault(destination,
+                                                  [0, 0, 0, None, None])
+            totals[0] += files
+            totals[1:] = transfer.merge_stats(totals[1:], stats)
+
+    def write(self, record):
+        """Append a JSON document to the JSON lines file, if there is one.
+
+        Keyword arguments:
+        record -- a JSON serialisable dict
+        """
+        if self.jsonl_path is None:
+            return
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.jsonl_path, "a") as fp:
+                fp.write(line)
+
+    def as_dict(self):
+        """Return a dict of the stages and destinations, as described for the
+        instance variables.
+        """
+        with self._lock:
+            return {
+                "stages": {stage: list(totals) for stage, totals in
+                           self.stages.items()},
+                "destinations": {destination: list(totals) for destination,
+                                 totals in self.destinations.items()}
+            }
+
+    def __str__(self):
+        lines = []
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: (
+                _STAGES.index(item[0]) if item[0] in _STAGES else len(_STAGES),
+                item[0]))
+            for stage, (count, seconds) in stages:
+                lines.append("%s: %.3f seconds over %s calls." %
+                             (stage, seconds, count))
+            for destination, (files, written, renamed, first_time,
+                              last_time) in sorted(self.destinations.items()):
+                rate = 0.0
+                if written:
+                    rate = written / 1e6 / max(last_time - first_time, 1e-9)
+                lines.append("%s: %s files; %s bytes written at %.1f MB/s; "
+                             "%s bytes renamed." % (destination, files,
+                                                    written, rate, renamed))
+        return "\n".join(lines)
+
+
+class Progress(object):
+    """Counts the files and bytes done per stage and per chapter and reports
+    them, with throughput and ETA, to a callback.  Updates arrive as each
+    buffer is written, so the callback is throttled to at most one call per
+    interval and an update between calls costs a lock and a clock read.  A
+    single instance may be shared by any number of threads and passed to
+    several calls.
+
+    Keyword arguments:
+    callback -- a callable taking the Progress object, called from whichever
+        thread made the update that fell due.  A call still running when the
+        next falls due causes that one to be dropped
+    interval -- the minimum number of seconds between calls (default 0.5)
+
+    The instance variables are as follows:
+    self.callback -- as above
+    self.interval -- as above
+    self.files -- the number of files done
+    self.size -- the number of bytes done
+    self.total_files -- the number of files expected, which grows as each
+        call plans more work
+    self.total_size -- the number of bytes expected, likewise
+    self.stages -- a dict mapping each stage, e.g. "extract", "move", "dedup"
+        or "encode", to a two item list of the files and bytes done in it
+    self.chapters -- a dict mapping each chapter, as a (course_id,
+        chapter_num) tuple or, when encoding, the directory of the file, to a
+        four item list of the files and bytes done and expected
+    self.stage -- the stage most recently updated
+    self.chapter -- the chapter most recently updated
+    self.recent_bytes_per_second -- the throughput since the previous call,
+        which falls to zero when the transfers stall
+    self.finished -- whether finish() has been called
+
+    The public methods are as follows:
+    method add_total -- Add files that are expected to be done.
+    method add -- Add files or bytes done.
+    method finish -- Call the callback a final time.
+    method bytes_per_second -- Return the throughput so far.
+    method eta -- Return the estimated seconds until everything is done.
+    """
+
+    def __init__(self, callback, interval=0.5):
+        self.callback = callback
+        self.interval = interval
+        self.files = 0
+        self.size = 0
+        self.total_files = 0
+        self.total_size = 0
+        self.stages = {}
+        self.chapters = {}
+        self.stage = None
+        self.chapter = None
+        self.recent_bytes_per_second = 0.0
+        self.finished = False
+        self._start_time = None
+        self._next_time = 0.0
+        self._last_time = None
+        self._last_size = 0
+        self._lock = threading.Lock()
+        self._callback_lock = threading.Lock()
+
+    def add_total(self, chapter, files, size):
+        """Add files that are expected to be done.  The throughput is
+        measured from the first call.
+
+        Keyword arguments:
+        chapter -- the chapter the files belong to, as described for
+            self.chapters
+        files -- the number of files
+        size -- the number of bytes
+        """
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = self._last_time = time.monotonic()
+            self.total_files += files
+            self.total_size += size
+            totals = self.chapters.setdefault(chapter, [0, 0, 0, 0])
+            totals[2] += files
+            totals[3] += size
+
+    def add(self, chapter, stage, size, files=0):
+        """Add files or bytes done, calling the callback if it is due.
+
+        Keyword arguments:
+        chapter -- the chapter the bytes belong to, as described for
+            self.chapters
+        stage -- the stage in which they were done
+        size -- the number of bytes done
+        files -- the number of files completed (default 0)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.files += files
+            self.size += size
+            totals = self.stages.setdefault(stage, [0, 0])
+            totals[0] += files
+            totals[1] += size
+            totals = self.chapters.setdefault(chapter, [0, 0, 0, 0])
+            totals[0] += files
+            totals[1] += size
+            self.stage = stage
+            self.chapter = chapter
+            if now < self._next_time:
+                return
+            self._next_time = now + self.interval
+            self._measure(now)
+        self._call()
+
+    def finish(self):
+        """Call the callback a final time with self.finished set, e.g. so
+        that a progress line can be ended.
+        """
+        with self._lock:
+            self.finished = True
+            self._measure(time.monotonic())
+        with self._callback_lock:
+            self.callback(self)
+
+    def _measure(self, now):
+        # Called with the lock held.
+        if self._last_time is not None and now > self._last_time:
+            self.recent_bytes_per_second = ((self.size - self._last_size) /
+                                            (now - self._last_time))
+        self._last_time = now
+        self._last_size = self.size
+
+    def _call(self):
+        if not self._callback_lock.acquire(False):
+            return
+        try:
+            self.callback(self)
+        finally:
+            self._callback_lock.release()
+
+    def bytes_per_second(self):
+        """Return the average bytes per second done since the first files
+        were expected.
+        """
+        if self._start_time is None:
+            return 0.0
+        seconds = time.monotonic() - self._start_time
+        return self.size / seconds if seconds else 0.0
+
+    def eta(self):
+        """Return the estimated number of seconds until every expected byte
+        is done at the average throughput, or None if nothing is done yet.
+        """
+        bytes_per_second = self.bytes_per_second()
+        if not bytes_per_second:
+            return None
+        return max(0, self.total_size - self.size) / bytes_per_second
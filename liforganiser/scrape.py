@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+
+"""Provides the HTTP and parsing layer used by liforganiser.Course to scrape
+LearnItFirst.com: pooled sessions which retry with backoff, a per-host rate
+limiter so that many courses can be scraped concurrently without hammering the
+website, an on-disk page cache and parsers for the course and TheBigList.aspx
+pages.
+
+This module exports the following names only:
+function new_session -- Return a requests.Session with a connection pool of
+    the given size which retries failed requests with backoff.
+class RateLimiter -- Enforces a minimum interval between requests to each
+    host, shared by any number of threads.
+class PageCache -- An on-disk cache of raw HTML responses keyed by URL which
+    revalidates with conditional requests.
+function fetch -- Make a GET request for a URL, optionally through a session,
+    a rate limiter and a page cache, and return the response.
+function parse_course_page -- Return the raw course title and the link to
+    the TheBigList.aspx page from a course page.
+function parse_big_list -- Return the raw chapter and lesson data from a
+    TheBigList.aspx page.
+
+View each name's docstring for more verbose information.
+"""
+
+from urllib import parse
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+
+from lxml import html
+from requests import adapters
+from urllib3.util import retry
+import bs4
+import requests
+
+from liforganiser import transfer
+
+
+# The website blocks requests coming from a programmatic-looking User-Agent.
+_HEADERS = {"User-Agent": "Chromium/Linux"}
+_TIMEOUT = 30
+_CACHE_DIR_PATH = os.path.join(os.path.dirname(__file__), "html_cache")
+_BIG_LIST_LINK_TEXT = "View the videos in this course"
+# Restrict the candidate links in XPath, then apply the same exact test as the
+# bs4 backend so that both backends agree.
+_BIG_LIST_LINK_XPATH = "//a[contains(., '%s')]" % _BIG_LIST_LINK_TEXT
+_CLASS_XPATH = ("descendant::div[contains(concat(' ', "
+                "normalize-space(@class), ' '), ' %s ')]")
+_NO_CHAPTERS_MESSAGE = ("The TheBigList.aspx page has changed structure and "
+                        "chapter data cannot be scraped.")
+_NO_LESSONS_MESSAGE = ("The TheBigList.aspx page has changed structure and "
+                       "lesson data cannot be scraped.")
+
+
+def new_session(pool_size=10, retries=3, backoff_factor=0.5):
+    """Return a requests.Session with a connection pool of the given size
+    which retries failed requests with backoff.
+
+    Keyword arguments:
+    pool_size -- the maximum number of connections kept open per host, which
+        should be at least the number of threads sharing the session (default
+        10)
+    retries -- the number of times a request is retried after a connection
+        error or a 5xx response (default 3)
+    backoff_factor -- the base, in seconds, of the exponential delay between
+        retries (default 0.5)
+    """
+    session = requests.Session()
+    session.headers.update(_HEADERS)
+    max_retries = retry.Retry(total=retries, backoff_factor=backoff_factor,
+                              status_forcelist=(500, 502, 503, 504))
+    adapter = adapters.HTTPAdapter(pool_connections=pool_size,
+                                   pool_maxsize=pool_size,
+                                   max_retries=max_retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class RateLimiter(object):
+    """Enforces a minimum interval between requests to each host, shared by
+    any number of threads.
+
+    Keyword arguments:
+    interval -- the minimum number of seconds between the start of two
+        requests to the same host
+
+    The instance variables are as follows:
+    self.interval -- as above
+
+    The other public methods are as follows:
+    method wait -- Block until a request to the URL's host is allowed.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    def wait(self, url):
+        """Block until a request to the URL's host is allowed.
+
+        Keyword arguments:
+        url -- the URL about to be requested
+        """
+        host = parse.urlsplit(url).netloc
+        with self._lock:
+            limiter = self._limiters.get(host)
+            if limiter is None:
+                # At one unit per second, consuming the interval reserves a
+                # slot that long.
+                limiter = self._limiters[host] = transfer.BandwidthLimiter(1)
+        limiter.consume(self.interval)
+
+
+class _CachedPage(object):
+    # Quacks like the parts of requests.Response that Course.from_url uses.
+    def __init__(self, text):
+        self.status_code = requests.codes.ok
+        self.text = text
+
+
+class PageCache(object):
+    """An on-disk cache of raw HTML responses keyed by URL which revalidates
+    with conditional requests, so that unchanged pages are not downloaded
+    again and scraper fixes can re-parse pages offline.
+
+    Keyword arguments:
+    path -- the full path to the directory in which pages are cached.  If no
+        value is passed, ./html_cache/ is used (default None)
+
+    The instance variables are as follows:
+    self.path -- as above
+
+    The other public methods are as follows:
+    method get -- Return the cached text and validators for a URL.
+    method put -- Cache a successful response for a URL.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or _CACHE_DIR_PATH
+
+    def _paths(self, url):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base_path = os.path.join(self.path, key)
+        return (base_path + os.extsep + "html",
+                base_path + os.extsep + "json")
+
+    def get(self, url):
+        """Return a (text, validators) tuple for a URL where validators is a
+        dict of the ETag and Last-Modified headers, or None if the URL is not
+        cached.
+
+        Keyword arguments:
+        url -- the URL whose cached page should be returned
+        """
+        html_path, json_path = self._paths(url)
+        try:
+            with open(json_path) as fp:
+                metadata = json.load(fp)
+            with open(html_path, "rb") as fp:
+                content = fp.read()
+        except (OSError, ValueError):
+            return None
+        return (content.decode(metadata["encoding"] or "utf-8", "replace"),
+                metadata["validators"])
+
+    def put(self, url, response):
+        """Cache a successful response for a URL.
+
+        Keyword arguments:
+        url -- the URL that was requested
+        response -- the requests.Response returned for the URL
+        """
+        os.makedirs(self.path, exist_ok=True)
+        html_path, json_path = self._paths(url)
+        validators = {header: response.headers[header] for header in
+                      ("ETag", "Last-Modified") if header in response.headers}
+        metadata = {
+            "url": url,
+            "encoding": response.encoding,
+            "validators": validators
+        }
+        transfer.replace_file(html_path, response.content)
+        transfer.replace_file(json_path, json.dumps(metadata))
+
+
+def fetch(url, session=None, rate_limiter=None, cache=None, offline=False):
+    """Make a GET request for a URL, optionally through a session, a rate
+    limiter and a page cache, and return the response.
+
+    Keyword arguments:
+    url -- the URL to request
+    session -- a requests.Session as returned by new_session() through which
+        the request should be made.  If no value is passed, a one-off
+        connection is used (default None)
+    rate_limiter -- a RateLimiter to wait on before making the request
+        (default None)
+    cache -- a PageCache.  If the URL is cached, the request is made
+        conditional on the cached validators and the cached page is returned
+        if the server reports it unchanged (default None)
+    offline -- whether the cached page should be returned without making any
+        request at all.  A requests.exceptions.RequestException is raised if
+        the URL is not cached (default False)
+    """
+    cached = None if cache is None else cache.get(url)
+    if offline:
+        if cached is None:
+            raise requests.exceptions.RequestException("no cached copy of %s "
+                                                       "is available offline"
+                                                       % url)
+        return _CachedPage(cached[0])
+    headers = dict(_HEADERS)
+    if cached is not None:
+        validators = cached[1]
+        if "ETag" in validators:
+            headers["If-None-Match"] = validators["ETag"]
+        if "Last-Modified" in validators:
+            headers["If-Modified-Since"] = validators["Last-Modified"]
+    if rate_limiter is not None:
+        rate_limiter.wait(url)
+    if session is None:
+        response = requests.get(url, headers=headers, timeout=_TIMEOUT)
+    else:
+        response = session.get(url, headers=headers, timeout=_TIMEOUT)
+    if response.status_code == requests.codes.not_modified and cached:
+        return _CachedPage(cached[0])
+    if cache is not None and response.status_code == requests.codes.ok:
+        cache.put(url, response)
+    return response
+
+
+def _document(text):
+    try:
+        return html.document_fromstring(text)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration.
+        return html.document_fromstring(text.encode("utf-8"))
+
+
+def _string(element):
+    # The lxml equivalent of bs4's Tag.string; the text of an element with a
+    # single child, found recursively, or None if there is more than one.
+    if element is None:
+        return None
+    children = list(element)
+    if not children:
+        return element.text
+    if len(children) == 1 and not element.text and not children[0].tail:
+        return _string(children[0])
+    return None
+
+
+def parse_course_page(text, backend="lxml"):
+    """Return a (title, href) tuple from a course page where title is the raw
+    course title and href is the link to the TheBigList.aspx page, or None if
+    the link cannot be found.
+
+    Keyword arguments:
+    text -- the HTML of the course page
+    backend -- either "lxml", which runs targeted XPath queries over the
+        document, or "bs4", which builds and searches a full BeautifulSoup
+        tree (default "lxml")
+    """
+    if backend == "bs4":
+        soup = bs4.BeautifulSoup(text, "lxml")
+        title = soup.find("h1").string.strip()
+        for link in soup.find_all("a"):
+            string = link.string
+            if string is not None and string.strip() == _BIG_LIST_LINK_TEXT:
+                return title, link["href"]
+        return title, None
+    document = _document(text)
+    title = _string(document.find(".//h1")).strip()
+    for link in document.xpath(_BIG_LIST_LINK_XPATH):
+        string = _string(link)
+        if string is not None and string.strip() == _BIG_LIST_LINK_TEXT:
+            return title, link.get("href")
+    return title, None
+
+
+def _big_list_bs4(text):
+    soup = bs4.BeautifulSoup(text, "lxml")
+    chapter_divs = soup.find_all("div", "chapterTitle")
+    if not chapter_divs:
+        raise ValueError(_NO_CHAPTERS_MESSAGE)
+    for chapter_div in chapter_divs:
+        next_div = chapter_div.find_next_sibling("div")
+        if next_div is None:
+            raise ValueError(_NO_LESSONS_MESSAGE)
+        lesson_divs = next_div.find_all("div", "chapterBorder")
+        if not lesson_divs:
+            raise ValueError(_NO_LESSONS_MESSAGE)
+        lessons = []
+        for lesson_div in lesson_divs:
+            first_div, second_div = lesson_div.find_all("div", limit=2)
+            lessons.append((first_div.string, second_div.a.string))
+        yield chapter_div.h2.b.string, chapter_div.h2.a.string, lessons
+
+
+def _big_list_lxml(text):
+    chapter_divs = _document(text).xpath(_CLASS_XPATH % "chapterTitle")
+    if not chapter_divs:
+        raise ValueError(_NO_CHAPTERS_MESSAGE)
+    for chapter_div in chapter_divs:
+        # A truncated page may end at a chapter heading; PEP 479 would turn
+        # the StopIteration of a bare next() into a RuntimeError.
+        next_div = next(chapter_div.itersiblings("div"), None)
+        if next_div is None:
+            raise ValueError(_NO_LESSONS_MESSAGE)
+        lesson_divs = next_div.xpath(_CLASS_XPATH % "chapterBorder")
+        if not lesson_divs:
+            raise ValueError(_NO_LESSONS_MESSAGE)
+        lessons = []
+        for lesson_div in lesson_divs:
+            first_div, second_div = itertools.islice(
+                lesson_div.iterdescendants("div"), 2)
+            lessons.append((_string(first_div),
+                            _string(second_div.find(".//a"))))
+        heading = chapter_div.find(".//h2")
+        yield (_string(heading.find(".//b")), _string(heading.find(".//a")),
+               lessons)
+
+
+def parse_big_list(text, backend="lxml"):
+    """Return a list of (chapter_num, name, lessons) tuples from a
+    TheBigList.aspx page where name is the raw chapter name and lessons is a
+    list of (lesson_num, name) tuples.  A ValueError is raised if the page
+    structure has changed such that no chapters or lessons can be found.
+
+    Keyword arguments:
+    text -- the HTML of the TheBigList.aspx page
+    backend -- as described for parse_course_page (default "lxml")
+    """
+    if backend == "bs4":
+        raw_chapters = _big_list_bs4(text)
+    else:
+        raw_chapters = _big_list_lxml(text)
+    chapters = []
+    for heading, chapter_name, raw_lessons in raw_chapters:
+        chapter_num = int(re.match(r"Chapter\s+(\d+):",
+                                   heading.strip()).group(1))
+        start_slice = len("%s." % chapter_num)
+        lessons = [(int(lesson_string.strip()[start_slice:]),
+                    lesson_name.strip()) for lesson_string, lesson_name in
+                   raw_lessons]
+        chapters.append((chapter_num, chapter_name.strip(), lessons))
+    return chapters
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""Provides the content-addressed store used by liforganiser.Course.organise
+to deduplicate supplementary files, such as exercise databases and sample
+scripts, which are often byte-identical across chapters and courses.
+
+This module exports the following name only:
+class ContentStore -- A directory of files named by their size and SHA-256
+    digest, against which organised files are matched.
+
+View each name's docstring for more verbose information.
+"""
+
+import hashlib
+import os
+
+from liforganiser import transfer
+
+
+_BUFFER_SIZE = 8 * 1024 * 1024
+# The suffix of the file beside each stored file that records its mtime_ns
+# when it was stored.
+_STAMP_SUFFIX = ".mtime"
+
+
+class ContentStore(object):
+    """A directory of files named by their size and SHA-256 digest, against
+    which organised files are matched.  Each file is kept as
+    path/<size>/<digest>, so whether any stored file could match a new one is
+    answered by a single stat of its size directory, and only files whose
+    size matches are hashed.  The directory itself is the index, so any number
+    of threads or processes can share a store.
+
+    Where the file system cannot make reflinks, a stored file is hard linked
+    and so is the same file as the organised one it was stored from.  Each
+    stored file's mtime_ns is therefore recorded when it is stored, and a
+    stored file whose size or mtime_ns has since changed, e.g. because the
+    organised file was edited, is discarded rather than linked to.
+
+    Keyword arguments:
+    path -- the full path to the store directory, which must be on the same
+        device as the files linked to and from it and is created as files are
+        added
+
+    The instance variables are as follows:
+    self.path -- as above
+
+    The public methods are as follows:
+    method has_size -- Return whether any stored file has a given size.
+    method object_path -- Return the path at which a file is or would be
+        stored.
+    method lookup -- Return the path of an unchanged stored file.
+    method digest -- Return the SHA-256 digest of a file object's contents.
+    method add -- Store a file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._transferer = transfer.Transferer()
+
+    def has_size(self, size):
+        """Return whether any stored file has the given size.
+
+        Keyword arguments:
+        size -- the size of a file in bytes
+        """
+        return os.path.isdir(os.path.join(self.path, str(size)))
+
+    def object_path(self, size, digest):
+        """Return the path at which a file of the given size and digest is or
+        would be stored.  Its directory is created if necessary.
+
+        Keyword arguments:
+        size -- the size of the file in bytes
+        digest -- the hexadecimal SHA-256 digest of the file, as returned by
+            digest()
+        """
+        dir_path = os.path.join(self.path, str(size))
+        os.makedirs(dir_path, exist_ok=True)
+        return os.path.join(dir_path, digest)
+
+    def lookup(self, size, digest):
+        """Return the path of the stored file with the given size and digest,
+        or None if there is none or it has changed since it was stored, in
+        which case it is removed from the store.
+
+        Keyword arguments:
+        size, digest -- as described for object_path()
+        """
+        object_path = self.object_path(size, digest)
+        try:
+            stat = os.stat(object_path)
+        except FileNotFoundError:
+            return None
+        try:
+            with open(object_path + _STAMP_SUFFIX) as fp:
+                mtime_ns = int(fp.read())
+        except (OSError, ValueError):
+            mtime_ns = None
+        if stat.st_size == size and stat.st_mtime_ns == mtime_ns:
+            return object_path
+        # Only the store's own names are removed; any organised file linked
+        # to the stored file is left as it is.
+        for path in (object_path, object_path + _STAMP_SUFFIX):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return None
+
+    @classmethod
+    def digest(cls, fp):
+        """Return the hexadecimal SHA-256 digest of a file object's contents.
+
+        Keyword arguments:
+        fp -- a readable binary file object, e.g. an open zip file member
+        """
+        sha256 = hashlib.sha256()
+        while True:
+            buffer = fp.read(_BUFFER_SIZE)
+            if not buffer:
+                break
+            sha256.update(buffer)
+        return sha256.hexdigest()
+
+    def add(self, path, size, digest):
+        """Store a file by linking it into the store, replacing any stored
+        file with the same size and digest, record its mtime_ns and return the
+        stored path.
+
+        Keyword arguments:
+        path -- the full path to the file, which must be on the same device
+            as the store
+        size, digest -- as described for object_path()
+        """
+        object_path = self.object_path(size, digest)
+        self._transferer.link(path, object_path)
+        transfer.replace_file(object_path + _STAMP_SUFFIX,
+                              str(os.stat(object_path).st_mtime_ns))
+        return object_path
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+
+"""Provides the file transfer layer used by liforganiser.Course.organise to
+move walked files and write decompressed zip members into their destination
+directories as cheaply as the underlying file systems allow, optionally
+checksumming the data as it passes through.
+
+This module exports the following names only:
+class Transferer -- Moves and writes files into destination directories,
+    renaming within a device and copying with the kernel across devices, and
+    records the throughput achieved per destination.
+class BandwidthLimiter -- Caps the rate at which bytes are written to a
+    device, or anything else is consumed, shared by any number of threads.
+function merge_stats -- Add one Transferer's stats for a destination to
+    another's.
+function replace_file -- Write a file under a temporary name and rename it
+    into place.
+function lock_file -- Take an exclusive lock on an open file.
+
+View each name's docstring for more verbose information.
+"""
+
+import errno
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows has no ioctl, so no reflinks, and no flock.
+    fcntl = None
+
+
+_BUFFER_SIZE = 8 * 1024 * 1024
+# The FICLONE ioctl request number from linux/fs.h; supported by btrfs, XFS
+# and other copy-on-write file systems.
+_FICLONE = 0x40049409
+# Errors that mean a copy mechanism is unsupported for this pair of files
+# rather than that the copy itself has failed.
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF,
+                       errno.EOPNOTSUPP, errno.ENOTTY, errno.EPERM}
+_logger = logging.getLogger(__name__)
+
+
+def merge_stats(totals, stats):
+    """Add the stats recorded by a Transferer for a destination to a running
+    total for it, in place, and return the total.  The bytes are summed and
+    the window widened to span both, so that transfers made concurrently by
+    several Transferers are timed once rather than once per Transferer.
+
+    Keyword arguments:
+    totals -- a four item list as described for Transferer.stats
+    stats -- another such list
+    """
+    totals[0] += stats[0]
+    totals[1] += stats[1]
+    if stats[2] is not None:
+        if totals[2] is None or stats[2] < totals[2]:
+            totals[2] = stats[2]
+        if totals[3] is None or stats[3] > totals[3]:
+            totals[3] = stats[3]
+    return totals
+
+
+def replace_file(path, data):
+    """Write data to a file under a temporary name and rename it over path, so
+    that a reader never sees a partial file and the last of several
+    concurrent writers wins.  The temporary name is unique to the thread and
+    host, since the file may be on storage shared with other hosts.
+
+    Keyword arguments:
+    path -- the full path to the file
+    data -- the str or bytes to be written
+    """
+    temp_path = "%s.%s.%s.%s.tmp" % (path, socket.gethostname(), os.getpid(),
+                                     threading.get_ident())
+    with open(temp_path, "wb" if isinstance(data, bytes) else "w") as fp:
+        fp.write(data)
+    os.replace(temp_path, path)
+
+
+def lock_file(fp):
+    """Take an exclusive lock on an open file, blocking until it is free, for
+    as long as the file stays open.  Where there is no flock, i.e. on
+    Windows, nothing is locked.
+
+    Keyword arguments:
+    fp -- the open file object
+    """
+    if fcntl is not None:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+
+
+def _rate(stats):
+    # Return the bytes written per second over the window in a four item
+    # list as described for Transferer.stats.
+    if stats[2] is None or stats[3] <= stats[2]:
+        return 0.0
+    return stats[0] / (stats[3] - stats[2])
+
+
+def _clone(fsrc, fdst):
+    # Ask the file system to share the source's extents with the destination,
+    # which costs no data I/O at all where it is supported.
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except OSError as error:
+        if error.errno in _UNSUPPORTED_ERRNOS:
+            return False
+        raise
+    return True
+
+
+def _copy_range(fsrc, fdst, offset, size, buffer_size, limiter=None,
+                on_bytes=None):
+    # Copy in the kernel with copy_file_range, falling back to sendfile.
+    # Return the offset reached so that a fallback can carry on from there.
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    for function in (getattr(os, "copy_file_range", None),
+                     getattr(os, "sendfile", None)):
+        if function is None:
+            continue
+        try:
+            while offset < size:
+                count = min(buffer_size, size - offset)
+                if limiter is not None:
+                    limiter.consume(count)
+                if function is os.sendfile:
+                    os.lseek(out_fd, offset, os.SEEK_SET)
+                    copied = os.sendfile(out_fd, in_fd, offset, count)
+                else:
+                    copied = os.copy_file_range(in_fd, out_fd, count,
+                                                offset, offset)
+                if not copied:
+                    break
+                offset += copied
+                if on_bytes is not None:
+                    on_bytes(copied)
+        except OSError as error:
+            if error.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            continue
+        break
+    return offset
+
+
+class BandwidthLimiter(object):
+    """Caps the rate at which bytes are written to a device, shared by any
+    number of threads.  A limiter passed to a process pool is copied, so each
+    process should be given its share of the bandwidth.  Nothing ties it to
+    bytes: scrape.RateLimiter consumes seconds from one per host.
+
+    Keyword arguments:
+    bytes_per_second -- the maximum average number of bytes per second
+
+    The instance variables are as follows:
+    self.bytes_per_second -- as above
+
+    The other public methods are as follows:
+    method consume -- Block until a number of bytes may be written.
+    """
+
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_time = None
+
+    def __getstate__(self):
+        return {"bytes_per_second": self.bytes_per_second}
+
+    def __setstate__(self, state):
+        self.__init__(state["bytes_per_second"])
+
+    def consume(self, size):
+        """Block until size bytes may be written without exceeding the
+        bandwidth.
+
+        Keyword arguments:
+        size -- the number of bytes about to be written
+        """
+        with self._lock:
+            # Reserve the next slot whilst holding the lock so that the
+            # waiting itself can happen concurrently.
+            now = time.time()
+            start_time = max(now, self._next_time or now)
+            self._next_time = start_time + size / self.bytes_per_second
+        if start_time > now:
+            time.sleep(start_time - now)
+
+
+class Transferer(object):
+    """Moves and writes files into destination directories, renaming within a
+    device and copying with the kernel across devices, and records the
+    throughput achieved per destination.
+
+    Keyword arguments:
+    buffer_size -- the number of bytes to copy per system call or read when
+        copying across devices (default 8 MiB)
+    verify -- whether the CRC-32 of each file should be computed as it is
+        transferred.  Copies across devices are then made by reading and
+        writing rather than in the kernel, so that the data is checksummed
+        in the same pass that copies it (default False)
+    limiters -- a dict mapping the st_dev of a destination device to the
+        BandwidthLimiter that data written to it must pass through.  Renames
+        and links write no data and are never limited (default None)
+    on_bytes -- a callable called with a number of bytes as each buffer or
+        chunk of a move or write is done, and with the whole size of a file
+        renamed or cloned, e.g. to report progress (default None)
+
+    The instance variables are as follows:
+    self.buffer_size -- as above
+    self.verify -- as above
+    self.limiters -- as above
+    self.on_bytes -- as above
+    self.stats -- a dict mapping each destination passed to move() or write()
+        to a four item list of the bytes written to it, the bytes renamed into
+        it on their own device and the wall clock times, from time.time(), at
+        which the first write to it started and the last ended, or None
+        whilst nothing has been written.  Renames move no data, so they are
+        kept out of the bytes written and the window that a rate is taken
+        over
+    self.checksums -- a dict mapping the path of each file transferred whilst
+        verifying to a (size, crc32) tuple, where crc32 is None for a file
+        renamed on its own device since its data never moved
+
+    The public methods are as follows:
+    method move -- Move a file, creating its directory if necessary.
+    method write -- Write the contents of a file object to a new file,
+        creating its directory if necessary.
+    method link -- Make a file share the data of another on the same device.
+    method rates -- Return the bytes per second written per destination.
+    """
+
+    def __init__(self, buffer_size=_BUFFER_SIZE, verify=False,
+                 limiters=None, on_bytes=None):
+        self.buffer_size = buffer_size
+        self.verify = verify
+        self.limiters = limiters or {}
+        self.on_bytes = on_bytes
+        self.stats = {}
+        self.checksums = {}
+        self._dir_paths = set()
+        self._devices = {}
+
+    def _make_dirs(self, dir_path):
+        # Each chapter writes hundreds of files into a handful of directories,
+        # so only the first file in a directory pays for the check.
+        if dir_path not in self._dir_paths:
+            os.makedirs(dir_path, exist_ok=True)
+            self._dir_paths.add(dir_path)
+
+    def _device(self, dir_path):
+        device = self._devices.get(dir_path)
+        if device is None:
+            device = self._devices[dir_path] = os.stat(dir_path).st_dev
+        return device
+
+    def _record(self, destination, size, start_time=None):
+        # Record a write of size bytes begun at start_time, or a rename if
+        # start_time is None.
+        stats = self.stats.setdefault(destination, [0, 0, None, None])
+        if start_time is None:
+            stats[1] += size
+        else:
+            merge_stats(stats, [size, 0, start_time, time.time()])
+
+    def _copy_buffers(self, fsrc, fdst, limiter=None, checksum=False):
+        # Copy through Python, the only way to see the data, and return the
+        # number of bytes copied and their CRC-32 if checksum is set.
+        size = 0
+        crc32 = 0 if checksum else None
+        while True:
+            buffer = fsrc.read(self.buffer_size)
+            if not buffer:
+                break
+            if limiter is not None:
+                limiter.consume(len(buffer))
+            if checksum:
+                crc32 = zlib.crc32(buffer, crc32)
+            fdst.write(buffer)
+            size += len(buffer)
+            if self.on_bytes is not None:
+                self.on_bytes(len(buffer))
+        return size, crc32
+
+    def _copy(self, src_path, dst_path, size, limiter=None):
+        with open(src_path, "rb") as fsrc, open(dst_path, "wb") as fdst:
+            if _clone(fsrc, fdst):
+                if self.on_bytes is not None:
+                    self.on_bytes(size)
+                return
+            offset = _copy_range(fsrc, fdst, 0, size, self.buffer_size,
+                                 limiter, self.on_bytes)
+            if offset < size:
+                fsrc.seek(offset)
+                fdst.seek(offset)
+                self._copy_buffers(fsrc, fdst, limiter)
+
+    def _copy_verified(self, src_path, dst_path, size, limiter=None):
+        # Return the CRC-32 of the data as it was copied.
+        with open(src_path, "rb") as fsrc, open(dst_path, "wb") as fdst:
+            crc32 = self._copy_buffers(fsrc, fdst, limiter, True)[1]
+            fdst.flush()
+            written = os.fstat(fdst.fileno()).st_size
+        if written != size:
+            raise OSError("%s bytes of %s were copied to %s" %
+                          (written, size, dst_path))
+        return crc32
+
+    def move(self, src_path, dst_path, destination=None):
+        """Move a file, creating its directory if necessary, and return the
+        number of bytes moved.
+
+        Keyword arguments:
+        src_path -- the full path to the file to be moved
+        dst_path -- the full path that the file should be moved to
+        destination -- the key under which the transfer is recorded in
+            self.stats, ordinarily the destination root directory (default
+            None)
+        """
+        start_time = time.time()
+        dir_path = os.path.dirname(dst_path)
+        self._make_dirs(dir_path)
+        src_stat = os.stat(src_path)
+        crc32 = None
+        device = self._device(dir_path)
+        if src_stat.st_dev == device:
+            os.rename(src_path, dst_path)
+            if self.on_bytes is not None:
+                self.on_bytes(src_stat.st_size)
+            start_time = None
+        else:
+            _logger.debug("Copying %s across devices to %s", src_path,
+                          dst_path)
+            limiter = self.limiters.get(device)
+            if self.verify:
+                crc32 = self._copy_verified(src_path, dst_path,
+                                            src_stat.st_size, limiter)
+            else:
+                self._copy(src_path, dst_path, src_stat.st_size, limiter)
+            shutil.copystat(src_path, dst_path)
+            os.unlink(src_path)
+        if self.verify:
+            self.checksums[dst_path] = (src_stat.st_size, crc32)
+        self._record(destination, src_stat.st_size, start_time)
+        return src_stat.st_size
+
+    def write(self, fsrc, dst_path, destination=None, crc32=None):
+        """Write the contents of a file object to a new file, creating its
+        directory if necessary, and return the number of bytes written.
+
+        Keyword arguments:
+        fsrc -- a readable binary file object, i.e. an open zip file member
+        dst_path -- the full path of the file to be written
+        destination -- the key under which the transfer is recorded in
+            self.stats, ordinarily the destination root directory (default
+            None)
+        crc32 -- the CRC-32 that the contents are already known to have,
+            which is recorded rather than computed when verifying.  An open
+            zip file member checks its data against the CRC-32 in the zip
+            file as it is read, raising zipfile.BadZipFile at the end if they
+            differ, so passing the member's CRC-32 costs nothing (default
+            None)
+        """
+        start_time = time.time()
+        dir_path = os.path.dirname(dst_path)
+        self._make_dirs(dir_path)
+        limiter = None
+        if self.limiters:
+            limiter = self.limiters.get(self._device(dir_path))
+        checksum = self.verify and crc32 is None
+        with open(dst_path, "wb") as fdst:
+            size, computed_crc32 = self._copy_buffers(fsrc, fdst, limiter,
+                                                      checksum)
+        if checksum:
+            crc32 = computed_crc32
+        if self.verify:
+            self.checksums[dst_path] = (size, crc32)
+        self._record(destination, size, start_time)
+        return size
+
+    def link(self, src_path, dst_path, crc32=None):
+        """Make a file share the data of another on the same device, replacing
+        it if it exists and creating its directory if necessary.  A reflink is
+        made where the file system supports them, so that the two files stay
+        independent; otherwise the files are hard linked and so are the same
+        file thereafter.  Nothing is recorded in self.stats since no data is
+        written.
+
+        Keyword arguments:
+        src_path -- the full path to the file whose data should be shared
+        dst_path -- the full path of the file to be made
+        crc32 -- as described for write(), recorded in self.checksums when
+            verifying (default None)
+        """
+        dir_path = os.path.dirname(dst_path)
+        self._make_dirs(dir_path)
+        # Linking to a temporary name and renaming it over dst_path means a
+        # reader never sees a missing or partial file.
+        temp_path = os.path.join(dir_path, ".%s.%s.%s.tmp" % (
+            os.path.basename(dst_path), os.getpid(), threading.get_ident()))
+        with open(src_path, "rb") as fsrc, open(temp_path, "wb") as fdst:
+            cloned = _clone(fsrc, fdst)
+        if cloned:
+            shutil.copystat(src_path, temp_path)
+        else:
+            os.remove(temp_path)
+            os.link(src_path, temp_path)
+        os.replace(temp_path, dst_path)
+        if os.path.lexists(temp_path):
+            # Renaming a hard link over another link to the same file does
+            # nothing, which leaves the temporary name behind.
+            os.remove(temp_path)
+        if self.verify:
+            self.checksums[dst_path] = (os.path.getsize(dst_path), crc32)
+
+    def rates(self):
+        """Return a dict mapping each destination to the bytes per second
+        written to it between the start of the first write and the end of the
+        last, excluding renames.
+        """
+        return {destination: _rate(stats) for destination, stats in
+                self.stats.items()}
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+"""Provides the directory watchers used by liforganiser.watch_many to notice
+course chapters arriving in a source directory, using inotify where the
+platform provides it and polling otherwise.
+
+This module exports the following names only:
+class InotifyWatcher -- Reports the names of entries created, written or
+    moved into a directory, as notified by the Linux kernel.
+class PollingWatcher -- Reports the names of entries created or changed in
+    a directory by listing it periodically.
+function new_watcher -- Return an InotifyWatcher for a directory where
+    inotify is available, or a PollingWatcher otherwise.
+function signature -- Return a tuple that changes whenever a file or
+    directory tree is written to.
+
+View each name's docstring for more verbose information.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+
+# From linux/inotify.h.
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+_EVENT_STRUCT = struct.Struct("iIII")
+_logger = logging.getLogger(__name__)
+
+
+class InotifyWatcher(object):
+    """Reports the names of entries created, written or moved into a
+    directory, as notified by the Linux kernel.  An OSError is raised if
+    inotify is unavailable.
+
+    Keyword arguments:
+    path -- the full path to the directory to be watched
+
+    The instance variables are as follows:
+    self.path -- as above
+
+    InotifyWatcher objects can be used as context managers, which call close()
+    on exit.
+
+    The public methods are as follows:
+    method wait -- Return the names of the entries changed since the last
+        call, waiting for up to a timeout for any to change.
+    method close -- Stop watching the directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        library_name = ctypes.util.find_library("c")
+        try:
+            libc = ctypes.CDLL(library_name, use_errno=True)
+            inotify_init1 = libc.inotify_init1
+            inotify_add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError):
+            raise OSError("inotify is not available on this platform")
+        self._fd = inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        # Only the top level is watched; a chapter directory copied into place
+        # is noticed by its creation and then checked for stability by
+        # stat-ing it.
+        if inotify_add_watch(self._fd, os.fsencode(path), _IN_CLOSE_WRITE |
+                             _IN_MOVED_TO | _IN_CREATE) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, os.strerror(error), path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def wait(self, timeout):
+        """Return a set of the names of the entries created, written or moved
+        into the directory since the last call, waiting for up to timeout
+        seconds for any to change.
+
+        Keyword arguments:
+        timeout -- the maximum number of seconds to wait
+        """
+        readable = select.select([self._fd], [], [], timeout)[0]
+        names = set()
+        while readable:
+            try:
+                buffer = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = _EVENT_STRUCT.unpack_from(buffer,
+                                                                     offset)
+                offset += _EVENT_STRUCT.size
+                name = buffer[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if name:
+                    names.add(os.fsdecode(name))
+        return names
+
+    def close(self):
+        """Stop watching the directory."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class PollingWatcher(object):
+    """Reports the names of entries created or changed in a directory by
+    listing it periodically.
+
+    Keyword arguments:
+    path -- the full path to the directory to be watched
+
+    The instance variables are as follows:
+    self.path -- as above
+
+    PollingWatcher objects can be used as context managers, which call close()
+    on exit.
+
+    The public methods are as follows:
+    method wait -- Return the names of the entries changed since the last
+        call, waiting for up to a timeout for any to change.
+    method close -- Stop watching the directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._stats = self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _scan(self):
+        stats = {}
+        for entry in os.scandir(self.path):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            stats[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+
+    def wait(self, timeout):
+        """Return a set of the names of the entries created or changed in
+        the directory since the last call, having waited timeout seconds.
+
+        Keyword arguments:
+        timeout -- the number of seconds to wait before listing the directory
+        """
+        time.sleep(timeout)
+        stats = self._scan()
+        names = {name for name, stat in stats.items() if
+                 self._stats.get(name) != stat}
+        self._stats = stats
+        return names
+
+    def close(self):
+        """Stop watching the directory."""
+        self._stats = {}
+
+
+def new_watcher(path):
+    """Return an InotifyWatcher for a directory where inotify is available,
+    or a PollingWatcher otherwise.
+
+    Keyword arguments:
+    path -- the full path to the directory to be watched
+    """
+    try:
+        return InotifyWatcher(path)
+    except OSError as error:
+        _logger.info("inotify is unavailable (%s); %s will be polled "
+                     "instead." % (error, path))
+        return PollingWatcher(path)
+
+
+def signature(path):
+    """Return a (files, size, mtime) tuple for a file or directory tree, where
+    files is the number of files, size their total size and mtime the latest
+    modification time, or None if the path no longer exists.  An entry is
+    complete once its signature has stopped changing.
+
+    Keyword arguments:
+    path -- the full path to the file or directory
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isdir(path):
+        return 1, stat.st_size, stat.st_mtime
+    files, size, mtime = 0, 0, stat.st_mtime
+    for root, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                stat = os.stat(os.path.join(root, file_name))
+            except OSError:
+                continue
+            files += 1
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return files, size, mtime
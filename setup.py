@@ -23,14 +23,19 @@ setup(name="LIFOrganiser",
           "Natural Language :: English",
           "Operating System :: OS Independent",
           "Programming Language :: Python :: 3",
-          "Programming Language :: Python :: 3.0",
-          "Programming Language :: Python :: 3.1",
-          "Programming Language :: Python :: 3.2",
-          "Programming Language :: Python :: 3.3",
-          "Programming Language :: Python :: 3.4",
+          "Programming Language :: Python :: 3 :: Only",
+          "Programming Language :: Python :: 3.7",
+          "Programming Language :: Python :: 3.8",
+          "Programming Language :: Python :: 3.9",
+          "Programming Language :: Python :: 3.10",
+          "Programming Language :: Python :: 3.11",
           "Topic :: Education"],
       keywords="LearnItFirst Course Organiser File-Renamer",
-      packages="liforganiser",
+      packages=["liforganiser"],
+      python_requires=">=3.7",
+      entry_points={
+          "console_scripts": ["liforganiser = liforganiser:_main"]},
       install_requires=[
           "BeautifulSoup4",
+          "lxml",
           "requests"])